@@ -0,0 +1,84 @@
+"""Benchmark the code execution backends on the questions.json problems.
+
+Usage:
+    python bench_executor.py [--backends piston local] [--runs 10] [--concurrency 8] [--duration 10]
+
+For every problem the starter code is submitted through submit_code(), so each
+run exercises the full path (harness build, execution, result parsing).
+Latency is measured one submission at a time; throughput keeps --concurrency
+submissions in flight for --duration seconds.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import main3
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def measure_latency(problems, runs):
+    timings = []
+    for _ in range(runs):
+        for p in problems:
+            start = time.perf_counter()
+            await main3.submit_code(p["id"], p.get("signature", ""))
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def measure_throughput(problems, concurrency, duration):
+    done = 0
+    deadline = time.monotonic() + duration
+
+    async def client(i):
+        nonlocal done
+        while time.monotonic() < deadline:
+            p = problems[(done + i) % len(problems)]
+            await main3.submit_code(p["id"], p.get("signature", ""))
+            done += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return done / (time.monotonic() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["piston", "local"], choices=["piston", "local"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    main3.load_questions()
+    problems = list(main3.QUESTION_BANK)
+    print(f"Benchmarking {len(problems)} problems: {args.runs} sequential rounds, "
+          f"{args.concurrency} concurrent clients for {args.duration:.0f}s")
+
+    rows = []
+    for backend in args.backends:
+        main3.Config.CODE_EXECUTOR = backend
+        if backend == "local":
+            main3.local_executor.pool_size = max(main3.local_executor.pool_size, args.concurrency)
+            await main3.local_executor.start()
+        timings = await measure_latency(problems, args.runs)
+        throughput = await measure_throughput(problems, args.concurrency, args.duration)
+        rows.append((backend, statistics.mean(timings), percentile(timings, 0.5),
+                     percentile(timings, 0.95), throughput))
+
+    print(f"{'backend':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'subs/s':>9}")
+    for backend, mean, p50, p95, tput in rows:
+        print(f"{backend:<8} {mean:>9.1f} {p50:>9.1f} {p95:>9.1f} {tput:>9.1f}")
+
+    await main3.local_executor.close()
+    if main3.piston_http is not None:
+        await main3.piston_http.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
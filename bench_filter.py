@@ -0,0 +1,91 @@
+"""Check and benchmark the transcript hallucination filter.
+
+Usage:
+    python bench_filter.py [--corpus hallucination_corpus.json] [--runs 20000]
+
+Every corpus entry is classified by the previous inline filter and by
+TranscriptFilter; entries on the wrong side are listed, then the per-call cost
+of both is measured on speech, on hallucinations and on the whole corpus.
+"""
+import argparse
+import json
+import logging
+import string
+import sys
+import time
+
+import main3
+
+
+def legacy_filter(text: str) -> str:
+    """The pre-refactor filter: lists rebuilt per call, substring pattern counts."""
+    cleaned = text.lower().translate(str.maketrans('', '', string.punctuation)).strip()
+    words = cleaned.split()
+    if len(words) > 10:
+        for pattern_length in [3, 4, 5]:
+            if len(words) >= pattern_length * 3:
+                pattern = ' '.join(words[:pattern_length])
+                if cleaned.count(pattern) >= 3:
+                    return ""
+    if len(words) > 5 and len(words) / len(set(words)) > 4:
+        return ""
+    hallucinations = [
+        "thanks for watching", "thank you for watching", "please subscribe",
+        "like and subscribe", "don't forget to subscribe",
+        "thank you", "you", "bye", "okay", "ok", "be", "to", "the", "it", "i", "me",
+        "a little bit of", "um", "uh", "hmm"
+    ]
+    if not words:
+        return ""
+    if all(w in hallucinations for w in words) or len(cleaned) < 2:
+        return ""
+    filler_words = {"a", "the", "of", "to", "and", "in", "is", "it", "that", "for", "on", "with", "as", "at", "by"}
+    if len(words) > 3 and sum(1 for w in words if w in filler_words) / len(words) > 0.8:
+        return ""
+    return text
+
+
+def check(name, fn, corpus):
+    missed = [t for t in corpus["hallucinations"] if fn(t)]
+    dropped = [t for t in corpus["speech"] if not fn(t)]
+    total = len(corpus["hallucinations"]) + len(corpus["speech"])
+    print(f"{name:<8} {total - len(missed) - len(dropped)}/{total} correct")
+    for t in missed:
+        print(f"    kept hallucination: {t!r}")
+    for t in dropped:
+        print(f"    dropped speech:     {t!r}")
+    return not missed and not dropped
+
+
+def bench(fn, texts, runs):
+    start = time.perf_counter()
+    for i in range(runs):
+        fn(texts[i % len(texts)])
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default="hallucination_corpus.json")
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    texts = corpus["hallucinations"] + corpus["speech"]
+    main3.logger.setLevel(logging.WARNING)  # Silence per-call filter logs
+
+    check("legacy", legacy_filter, corpus)
+    ok = check("current", main3.transcript_filter, corpus)
+
+    print(f"{'filter':<8} {'speech us':>10} {'halluc. us':>11} {'all us':>8}")
+    for name, fn in (("legacy", legacy_filter), ("current", main3.transcript_filter)):
+        speech_us = bench(fn, corpus["speech"], args.runs)
+        halluc_us = bench(fn, corpus["hallucinations"], args.runs)
+        all_us = bench(fn, texts, args.runs)
+        print(f"{name:<8} {speech_us:>10.2f} {halluc_us:>11.2f} {all_us:>8.2f}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the in-memory decode path of transcribe() against the old temp-WAV path.
+
+Usage:
+    python bench_transcribe.py clip.webm [--runs 20] [--decode-only]
+
+Each path runs in its own subprocess so the reported peak RSS is not polluted by
+the other one. --decode-only skips Whisper and measures the decode stage alone.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def legacy_path(model, data: bytes, decode_only: bool):
+    """The pre-refactor pipeline: pydub -> WAV BytesIO -> temp file -> Whisper."""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(io.BytesIO(data)).set_frame_rate(16000).set_channels(1)
+    wav_io = io.BytesIO()
+    audio.export(wav_io, format="wav")
+    wav_io.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+        tmp.write(wav_io.read())
+        tpath = tmp.name
+    try:
+        if not decode_only:
+            segs, _ = model.transcribe(tpath, beam_size=1, temperature=0.0, vad_filter=True)
+            " ".join(s.text for s in segs)
+    finally:
+        os.remove(tpath)
+
+
+def memory_path(model, data: bytes, decode_only: bool):
+    """The current pipeline: PyAV decode to float32 NumPy -> Whisper."""
+    from faster_whisper import decode_audio
+    audio = decode_audio(io.BytesIO(data), sampling_rate=16000)
+    if not decode_only:
+        segs, _ = model.transcribe(audio, beam_size=1, temperature=0.0, vad_filter=True)
+        " ".join(s.text for s in segs)
+
+
+def run_one(path: str, clip: str, runs: int, decode_only: bool):
+    with open(clip, "rb") as f:
+        data = f.read()
+    model = None
+    if not decode_only:
+        from faster_whisper import WhisperModel
+        model = WhisperModel(os.getenv("WHISPER_MODEL_SIZE", "base.en"), device="cpu",
+                             compute_type=os.getenv("WHISPER_COMPUTE", "int8"))
+    fn = legacy_path if path == "legacy" else memory_path
+    fn(model, data, decode_only)  # warm-up
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(model, data, decode_only)
+        timings.append((time.perf_counter() - start) * 1000)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings.sort()
+    print(json.dumps({
+        "path": path,
+        "runs": runs,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "peak_rss_mb": peak_rss / 1024,
+        "rss_growth_mb": (peak_rss - baseline_rss) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("clip", help="Encoded audio clip (e.g. a recorded webm utterance)")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--decode-only", action="store_true")
+    parser.add_argument("--path", choices=["legacy", "memory"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        run_one(args.path, args.clip, args.runs, args.decode_only)
+        return
+
+    print(f"Benchmarking {args.clip} ({args.runs} runs{', decode only' if args.decode_only else ''})")
+    results = {}
+    for path in ("legacy", "memory"):
+        cmd = [sys.executable, __file__, args.clip, "--runs", str(args.runs), "--path", path]
+        if args.decode_only:
+            cmd.append("--decode-only")
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results[path] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{'path':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'peak RSS MB':>12}")
+    for path, r in results.items():
+        print(f"{path:<8} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['peak_rss_mb']:>12.1f}")
+    speedup = results["legacy"]["mean_ms"] / max(results["memory"]["mean_ms"], 1e-9)
+    print(f"✅ In-memory path is {speedup:.2f}x the speed of the temp-WAV path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Build the local concept index that verify_concept checks before Wikipedia.
+
+Usage:
+    python build_concept_index.py [--topics concept_topics.txt] [--out concepts.db] [--concurrency 8]
+
+Each topic is fetched once with the same Wikipedia query verify_concept uses and
+the summaries are written to a SQLite FTS5 table. The file is replaced
+atomically, so it can be rebuilt while servers are reading it. Enable it with
+CONCEPT_INDEX_PATH=concepts.db.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import main3
+
+
+def read_topics(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+async def fetch_all(topics: list, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    rows, missing = [], []
+
+    async def fetch(topic):
+        async with semaphore:
+            try:
+                found = await main3.fetch_concept(topic)
+            except Exception as e:
+                print(f"❌ {topic}: {e!r}")
+                missing.append(topic)
+                return
+        if found is None:
+            print(f"⚠️ {topic}: no page")
+            missing.append(topic)
+            return
+        rows.append((topic, found[0], found[1]))
+
+    await asyncio.gather(*(fetch(t) for t in topics))
+    await main3.get_wiki_http().aclose()
+    return rows, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", default="concept_topics.txt", help="One topic per line; # starts a comment")
+    parser.add_argument("--out", default="concepts.db")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    topics = read_topics(args.topics)
+    print(f"Fetching {len(topics)} topics ({args.concurrency} at a time)")
+    start = time.monotonic()
+    rows, missing = asyncio.run(fetch_all(topics, args.concurrency))
+
+    tmp = args.out + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    main3.ConceptIndex.build(tmp, sorted(rows))
+    os.replace(tmp, args.out)
+    print(f"✅ Indexed {len(rows)} topics into {args.out} in {time.monotonic() - start:.1f}s ({len(missing)} missing)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Drive N synthetic interviews through /ws against stubbed Gemini, edge-tts and Piston.
+
+Usage:
+    python load_test.py [--sessions 20] [--turns 5] [--audio clip.webm] [--stt real|stub]
+                        [--llm-first lognormal:600:0.4] [--tts-first lognormal:250:0.3] ...
+
+The server runs in a subprocess (so its CPU time is measured on its own) with
+the external backends replaced by local stubs whose latency follows the given
+distributions: fixed:MS, uniform:LO_MS:HI_MS or lognormal:MEDIAN_MS:SIGMA.
+Whisper runs for real when --audio is given, unless --stt stub.
+
+Each session selects a role, answers --turns questions (the audio clip, or a
+text answer), submits code and requests feedback. Reported: client-side
+end-to-end latency per message type, server-side per-stage latency (from the
+sura_stage_seconds histograms), turns/s and sessions per fully used core.
+
+--url targets an already running server instead (no stubs, no CPU numbers).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import websockets
+
+ANSWER = "I built a service that processed events from Kafka and stored aggregates in Postgres."
+# Varied per reply so the TTS cache does not hide synthesis latency
+REPLY = ("Good answer for case {n}. How did you handle failures when a consumer crashed halfway "
+         "through batch {n}? And what would you change if the traffic grew {n} times?")
+FEEDBACK = {
+    "overall_score": 7,
+    "communication": {"score": 7, "feedback": "Clear answers."},
+    "technical_knowledge": {"score": 7, "feedback": "Solid fundamentals."},
+    "problem_solving": {"score": 7, "feedback": "Structured approach."},
+    "strengths": ["Clarity"],
+    "improvements": ["More depth"],
+    "summary": "Load test feedback.",
+}
+
+
+def parse_dist(spec: str):
+    """Returns a sampler in seconds for fixed:MS, uniform:LO:HI or lognormal:MEDIAN:SIGMA."""
+    kind, *params = spec.split(":")
+    p = [float(x) for x in params]
+    if kind == "fixed":
+        return lambda: p[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(p[0], p[1]) / 1000
+    if kind == "lognormal":
+        return lambda: p[0] * math.exp(random.gauss(0, p[1])) / 1000
+    raise ValueError(f"Unknown distribution {spec!r}")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def hist_quantile(buckets, row, q):
+    """Prometheus-style histogram_quantile over one series [counts..., sum, count]."""
+    total = row[-1]
+    if not total:
+        return float("nan")
+    rank, cumulative, lower = q * total, 0, 0.0
+    for bound, n in zip(buckets, row):
+        if n and cumulative + n >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / n
+        cumulative += n
+        lower = bound
+    return buckets[-1]  # In the +Inf bucket
+
+
+# --- SERVER (subprocess) ---
+def install_stubs(main3, args):
+    """Replaces Gemini, edge-tts, Piston (and optionally Whisper) with latency stubs."""
+    llm_first, llm_chunk = parse_dist(args.llm_first), parse_dist(args.llm_chunk)
+    tts_first, tts_chunk = parse_dist(args.tts_first), parse_dist(args.tts_chunk)
+    piston, stt = parse_dist(args.piston), parse_dist(args.stt_latency)
+
+    def response(text):
+        part = SimpleNamespace(text=text, function_call=None)
+        content = SimpleNamespace(role="model", parts=[part])
+        return SimpleNamespace(text=text, function_calls=None, candidates=[SimpleNamespace(content=content)])
+
+    class Models:
+        async def generate_content(self, model, contents, config=None):
+            await asyncio.sleep(llm_first())
+            if isinstance(contents, str):  # Feedback or history summary prompt
+                return response(json.dumps(FEEDBACK) if "feedback" in contents else "Notes: load test.")
+            return response(REPLY.format(n=random.randint(2, 99999)))
+
+        async def generate_content_stream(self, model, contents, config=None):
+            async def chunks():
+                await asyncio.sleep(llm_first())
+                words = REPLY.format(n=random.randint(2, 99999)).split(" ")
+                for i in range(0, len(words), 4):
+                    if i:
+                        await asyncio.sleep(llm_chunk())
+                    yield response(" ".join(words[i:i + 4]) + " ")
+            return chunks()
+
+    class Client:
+        def __init__(self, **kwargs):
+            self.aio = SimpleNamespace(models=Models())
+
+    class Communicate:
+        def __init__(self, text, voice):
+            self.frames = max(1, len(text) // 20)
+
+        async def stream(self):
+            for i in range(self.frames):
+                await asyncio.sleep(tts_first() if i == 0 else tts_chunk())
+                yield {"type": "audio", "data": b"\xff\xf3" * 2048}
+
+    async def execute_piston(script):
+        await asyncio.sleep(piston())
+        return {"run": {"stdout": "", "stderr": "", "code": 0}}
+
+    main3.genai.Client = Client
+    main3.edge_tts.Communicate = Communicate
+    main3.execute_piston = execute_piston
+
+    if args.stt == "stub":
+        class Scheduler:
+            replicas, loaded, failed = 1, 1, 0
+
+            def __init__(self):
+                self.ready = threading.Event()
+                self.ready.set()
+
+            def start(self):
+                pass
+
+            def wait_loaded(self):
+                pass
+
+            def depth(self):
+                return 0
+
+            async def transcribe(self, data):
+                await asyncio.sleep(stt())
+                return ANSWER
+
+        main3.SttScheduler = Scheduler
+
+
+def serve(args):
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    os.environ["PROMPT_CACHE"] = "off"
+    os.environ["CODE_EXECUTOR"] = "piston"
+    workdir = tempfile.mkdtemp(prefix="sura-load-")
+    os.environ["FEEDBACK_DB_PATH"] = os.path.join(workdir, "feedback.db")
+    os.environ["RESUME_STORE_PATH"] = os.path.join(workdir, "resumes.db")
+
+    import uvicorn
+    import main3
+    install_stubs(main3, args)
+
+    @main3.app.get("/loadtest/stats")
+    async def loadtest_stats():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with main3.STAGE_SECONDS.lock:
+            stages = {k: list(v) for k, v in main3.STAGE_SECONDS.series.items()}
+        return {"cpu_s": usage.ru_utime + usage.ru_stime, "buckets": main3.STAGE_SECONDS.buckets, "stages": stages}
+
+    uvicorn.run(main3.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --- CLIENT ---
+class Session:
+    """One synthetic interview; a reader task timestamps every server message."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.events = asyncio.Queue()
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for msg in self.ws:
+            event = {"type": "audio"} if isinstance(msg, bytes) else json.loads(msg)
+            self.events.put_nowait((time.perf_counter(), event))
+
+    async def wait_for(self, predicate, timeout):
+        """Time of the first event matching predicate, plus the first audio before it (if any)."""
+        first_audio = None
+        deadline = time.monotonic() + timeout
+        while True:
+            at, event = await asyncio.wait_for(self.events.get(), deadline - time.monotonic())
+            if first_audio is None and event["type"] in ("audio", "audio_start"):
+                first_audio = at
+            if predicate(event):
+                return at, first_audio
+
+
+async def run_session(url, args, audio, problem, samples, timeout=120):
+    async with websockets.connect(url, max_size=None) as ws:
+        session = Session(ws)
+        start = time.perf_counter()
+        await ws.send(json.dumps({"type": "role_selection", "role": args.role}))
+        at, _ = await session.wait_for(lambda e: e["type"] == "text", timeout)
+        samples["greeting"].append(at - start)
+
+        for _ in range(args.turns):
+            await asyncio.sleep(args.think_ms / 1000)
+            start = time.perf_counter()
+            if audio is not None:
+                await ws.send(audio)
+            else:
+                await ws.send(json.dumps({"type": "text", "text": ANSWER}))
+            at, first_audio = await session.wait_for(lambda e: e["type"] == "text" and "turn" in e, timeout)
+            samples["turn"].append(at - start)
+            if first_audio is not None:
+                samples["first_audio"].append(first_audio - start)
+
+        if problem:
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "code_submission", "problem_id": str(problem["id"]),
+                                      "code": problem.get("signature", "")}))
+            at, _ = await session.wait_for(lambda e: e["type"] == "code_result", timeout)
+            samples["code_submission"].append(at - start)
+
+        start = time.perf_counter()
+        await ws.send(json.dumps({"type": "request_feedback"}))
+        at, _ = await session.wait_for(lambda e: e["type"] == "feedback", timeout)
+        samples["feedback"].append(at - start)
+        session.reader.cancel()
+
+
+async def drive(args, base_url):
+    audio = open(args.audio, "rb").read() if args.audio else None
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json"), "r", encoding="utf-8") as f:
+        problem = (json.load(f) or [None])[0]
+    samples = {k: [] for k in ("greeting", "turn", "first_audio", "code_submission", "feedback")}
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+
+    async with httpx.AsyncClient() as http:
+        before = (await http.get(base_url + "/loadtest/stats")).json() if not args.url else None
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *(run_session(ws_url, args, audio, problem, samples) for _ in range(args.sessions)),
+            return_exceptions=True
+        )
+        wall = time.monotonic() - start
+        after = (await http.get(base_url + "/loadtest/stats")).json() if not args.url else None
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    print(f"\n{args.sessions} sessions x {args.turns} turns in {wall:.1f}s, {len(errors)} failed")
+    for e in errors[:3]:
+        print(f"    {e!r}")
+
+    print(f"\n{'client (end to end)':<24} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in samples.items():
+        if values:
+            print(f"{name:<24} {len(values):>6} {percentile(values, 0.5) * 1000:>9.1f} "
+                  f"{percentile(values, 0.95) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f}")
+
+    print(f"\nturns/s: {len(samples['turn']) / wall:.2f}")
+    if after:
+        print(f"\n{'server stage':<24} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        buckets = after["buckets"]
+        for stage, row in sorted(after["stages"].items()):
+            old = before["stages"].get(stage, [0] * len(row))
+            diff = [a - b for a, b in zip(row, old)]
+            if diff[-1]:
+                print(f"{stage:<24} {diff[-1]:>6} " + " ".join(
+                    f"{hist_quantile(buckets, diff, q) * 1000:>9.1f}" for q in (0.5, 0.95, 0.99)))
+        cores = (after["cpu_s"] - before["cpu_s"]) / wall
+        print(f"\nserver CPU: {cores:.2f} cores busy -> {args.sessions / max(cores, 1e-9):.1f} sessions per core")
+    return 1 if errors else 0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--role", default="software_engineer")
+    parser.add_argument("--think-ms", type=float, default=500, help="Pause before each answer")
+    parser.add_argument("--audio", help="Encoded utterance sent as each answer (e.g. a recorded webm)")
+    parser.add_argument("--stt", choices=["real", "stub"], help="Default: real with --audio, else stub")
+    parser.add_argument("--stt-latency", default="lognormal:300:0.3")
+    parser.add_argument("--llm-first", default="lognormal:600:0.4", help="Gemini time to first chunk")
+    parser.add_argument("--llm-chunk", default="fixed:60", help="Gemini gap between chunks")
+    parser.add_argument("--tts-first", default="lognormal:250:0.3", help="edge-tts time to first chunk")
+    parser.add_argument("--tts-chunk", default="fixed:30", help="edge-tts gap between chunks")
+    parser.add_argument("--piston", default="lognormal:400:0.5", help="Piston round trip")
+    parser.add_argument("--url", help="Existing server, e.g. http://localhost:8000 (no stubs)")
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.stt = args.stt or ("real" if args.audio else "stub")
+
+    if args.serve:
+        serve(args)
+        return
+    if args.url:
+        sys.exit(asyncio.run(drive(args, args.url.rstrip("/"))))
+
+    args.port = free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port)] + sys.argv[1:]
+    server = subprocess.Popen(cmd)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        deadline = time.monotonic() + 300  # Whisper load can take a while
+        while True:
+            try:
+                if httpx.get(base_url + "/readyz").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None or time.monotonic() > deadline:
+                sys.exit("Server did not start")
+            time.sleep(0.5)
+        code = asyncio.run(drive(args, base_url))
+    finally:
+        server.terminate()
+        server.wait()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,74 @@
+import time
+STARTED_AT = time.monotonic()  # Cold-start timing, reported by /readyz
+
 import asyncio
+import bisect
+import hashlib
+import importlib
+import inspect
 import os
 import json
 import logging
 import io
-import tempfile
-import requests
+import math
+import multiprocessing
 import re
+import sqlite3
 import random
+import secrets
+import shutil
+import signal
 import sys
-import wikipedia
+import tempfile
+import queue
+import threading
 import string
-import pypdf
-from fastapi import UploadFile, File
+import uuid
+import numpy as np
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, closing, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+from fastapi import UploadFile, File, Form
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from faster_whisper import WhisperModel
-from google import genai
-from google.genai import types
-import edge_tts
-from pydub import AudioSegment
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+import httpx
+from pydantic import BaseModel, Field
 from starlette.websockets import WebSocketState
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    Keeps the heavy SDKs (Whisper, genai, edge-tts, pypdf) off the
+    import path, so the server answers requests before they are loaded.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def _load(self):
+        return importlib.import_module(self._name)
+
+    def __getattr__(self, attr):
+        # Only reached for names not set on the proxy itself (tests may patch those)
+        return getattr(self._load(), attr)
+
+faster_whisper = LazyModule("faster_whisper")
+whisper_vad = LazyModule("faster_whisper.vad")
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+genai_errors = LazyModule("google.genai.errors")
+edge_tts = LazyModule("edge_tts")
+pypdf = LazyModule("pypdf")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -34,8 +80,90 @@ class Config:
     WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base.en")
     WHISPER_COMPUTE = os.getenv("WHISPER_COMPUTE", "int8")
     VOICE_NAME = os.getenv("VOICE_NAME", "en-US-AriaNeural")
+    TTS_STREAMING = os.getenv("TTS_STREAMING", "true").lower() == "true"
+    LLM_PIPELINE = os.getenv("LLM_PIPELINE", "true").lower() == "true"
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "0"))  # 0 = unlimited
+    LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+    LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_S = float(os.getenv("LLM_BACKOFF_S", "0.5"))
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")  # Empty = memory only
+    TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))  # 0 = unlimited
+    HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "12"))
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "400"))
+    FEEDBACK_TOKEN_BUDGET = int(os.getenv("FEEDBACK_TOKEN_BUDGET", "8000"))
+    FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", "feedback.db")
+    FEEDBACK_WORKERS = int(os.getenv("FEEDBACK_WORKERS", "2"))
+    FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "100"))
+    PROMPT_CACHE = os.getenv("PROMPT_CACHE", "gemini")  # gemini | mock | off
+    PROMPT_CACHE_TTL_S = float(os.getenv("PROMPT_CACHE_TTL_S", "3600"))
+    PROMPT_CACHE_REFRESH_S = float(os.getenv("PROMPT_CACHE_REFRESH_S", "300"))
+    PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Gemini's minimum cache size
     QUESTIONS_FILE = os.getenv("QUESTIONS_FILE", "questions.json")
+    RESUME_STORE = os.getenv("RESUME_STORE", "memory")  # memory | sqlite | redis
+    RESUME_STORE_PATH = os.getenv("RESUME_STORE_PATH", "resumes.db")
+    RESUME_CACHE_SIZE = int(os.getenv("RESUME_CACHE_SIZE", "1024"))
+    RESUME_REDIS_URL = os.getenv("RESUME_REDIS_URL", os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+    RESUME_TTL_S = int(os.getenv("RESUME_TTL_S", "86400"))  # Redis store: resume text and session bindings
+    SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # memory | sqlite | redis
+    SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+    SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", "3600"))
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+    QUESTIONS_RELOAD_INTERVAL_S = float(os.getenv("QUESTIONS_RELOAD_INTERVAL_S", "5"))
+    TRANSCRIPT_FILTER_FILE = os.getenv("TRANSCRIPT_FILTER_FILE", "")  # JSON phrase lists; empty = built-in
+    RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", str(5 * 1024 * 1024)))
+    RESUME_MAX_PAGES = int(os.getenv("RESUME_MAX_PAGES", "10"))
+    PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+    PDF_TIMEOUT_S = float(os.getenv("PDF_TIMEOUT_S", "15"))
+    RESUME_CHUNK_CHARS = int(os.getenv("RESUME_CHUNK_CHARS", "600"))
+    RESUME_TOP_K = int(os.getenv("RESUME_TOP_K", "3"))
+    RESUME_TOKEN_BUDGET = int(os.getenv("RESUME_TOKEN_BUDGET", "300"))
+    WIKI_API_URL = os.getenv("WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+    CONCEPT_TIMEOUT_S = float(os.getenv("CONCEPT_TIMEOUT_S", "8"))
+    CONCEPT_CACHE_SIZE = int(os.getenv("CONCEPT_CACHE_SIZE", "512"))
+    CONCEPT_CACHE_TTL_S = float(os.getenv("CONCEPT_CACHE_TTL_S", "86400"))
+    CONCEPT_INDEX_PATH = os.getenv("CONCEPT_INDEX_PATH", "")  # SQLite FTS index from build_concept_index.py; empty = off
+    CONCEPT_NETWORK_FALLBACK = os.getenv("CONCEPT_NETWORK_FALLBACK", "true").lower() == "true"
     PISTON_API_URL = os.getenv("PISTON_API_URL", "https://emkc.org/api/v2/piston/execute")
+    PISTON_TIMEOUT_S = float(os.getenv("PISTON_TIMEOUT_S", "20"))
+    PISTON_MAX_CONNECTIONS = int(os.getenv("PISTON_MAX_CONNECTIONS", "20"))
+    CODE_BATCH_TESTS = os.getenv("CODE_BATCH_TESTS", "true").lower() == "true"
+    CODE_EXECUTOR = os.getenv("CODE_EXECUTOR", "piston")  # piston | local
+    CODE_POOL_SIZE = int(os.getenv("CODE_POOL_SIZE", "4"))
+    CODE_CPU_LIMIT_S = int(os.getenv("CODE_CPU_LIMIT_S", "5"))
+    CODE_MEMORY_MB = int(os.getenv("CODE_MEMORY_MB", "256"))
+    CODE_WALL_TIMEOUT_S = float(os.getenv("CODE_WALL_TIMEOUT_S", "10"))
+    CODE_OUTPUT_LIMIT = int(os.getenv("CODE_OUTPUT_LIMIT", str(64 * 1024)))
+    STT_PARTIAL_INTERVAL_MS = int(os.getenv("STT_PARTIAL_INTERVAL_MS", "700"))
+    STT_MIN_SILENCE_MS = int(os.getenv("STT_MIN_SILENCE_MS", "500"))
+    STT_MIN_PARTIAL_MS = int(os.getenv("STT_MIN_PARTIAL_MS", "300"))
+    STT_PARTIAL_WINDOW_S = float(os.getenv("STT_PARTIAL_WINDOW_S", "6"))  # Trailing audio re-transcribed per partial
+    STT_REPLICAS = int(os.getenv("STT_REPLICAS", "0"))  # 0 = CPU cores / STT_CPU_THREADS
+    STT_CPU_THREADS = int(os.getenv("STT_CPU_THREADS", "2"))
+    STT_QUEUE_SIZE = int(os.getenv("STT_QUEUE_SIZE", "64"))
+    STT_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+    STT_BATCH_WINDOW_MS = int(os.getenv("STT_BATCH_WINDOW_MS", "20"))
+    STT_VAD_GATE = os.getenv("STT_VAD_GATE", "true").lower() == "true"
+    STT_VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", "-50"))
+    STT_VAD_MARGIN_DB = float(os.getenv("STT_VAD_MARGIN_DB", "10"))
+    STT_VAD_MIN_SPEECH_MS = int(os.getenv("STT_VAD_MIN_SPEECH_MS", "150"))
+    STT_VAD_PAD_MS = int(os.getenv("STT_VAD_PAD_MS", "300"))
+    MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "50"))  # Per worker; 0 = unlimited
+    SESSION_WAIT_QUEUE = int(os.getenv("SESSION_WAIT_QUEUE", "20"))
+    SESSION_WAIT_TIMEOUT_S = float(os.getenv("SESSION_WAIT_TIMEOUT_S", "120"))
+    TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "8"))  # 0 = unlimited
+    AUDIO_RATE_PER_SEC = float(os.getenv("AUDIO_RATE_PER_SEC", "8"))  # Audio messages per session; 0 = unlimited
+    AUDIO_BURST = int(os.getenv("AUDIO_BURST", "16"))
+    SHED_QUEUE_MS = float(os.getenv("SHED_QUEUE_MS", "1500"))  # 0 = never shed
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Required by /api/admin/* and /api/feedback, which are closed while unset
+    STARTUP_MODE = os.getenv("STARTUP_MODE", "background")  # background | blocking
+    STT_WARMUP = os.getenv("STT_WARMUP", "true").lower() == "true"
+    TRACE_FILE = os.getenv("TRACE_FILE", "")  # JSONL span export; empty = off
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", "8000"))
 
@@ -130,6 +258,14 @@ FLOW:
 RULES: Keep ALL responses under 3 sentences. ALWAYS reference their resume. Be professional. Focus on STAR method. NO coding."""
 }
 
+FALLBACK_REPLY = "I see. Could you tell me more about that?"
+ERROR_REPLY = "I apologize, I had a technical issue. Could you please repeat that?"
+
+def build_greeting(role: str, has_resume: bool) -> str:
+    if has_resume:
+        return f"Hello! I am SURA, your interview practice partner. I've reviewed your resume and I'll be conducting a {role.replace('_', ' ')} interview today. Let's begin - tell me about yourself?"
+    return f"Hello! I am SURA, your interview practice partner. I'll be conducting a {role.replace('_', ' ')} interview today. Let's begin - tell me about yourself?"
+
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -138,10 +274,509 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-whisper_model = None
+stt_scheduler = None
 client = None
-QUESTION_BANK = []
-RESUME_CONTEXT = ""
+startup_errors = {}  # component -> error, reported by /readyz
+QUESTION_BANK = None  # QuestionBank, see load_questions()
+
+# --- METRICS ---
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Prometheus histogram keyed by one label; safe to observe from STT threads."""
+
+    def __init__(self, name: str, help: str, label: str, buckets=STAGE_BUCKETS):
+        self.name, self.help, self.label, self.buckets = name, help, label, buckets
+        self.series = {}  # label value -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, key: str, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            row = self.series.get(key)
+            if row is None:
+                row = self.series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for key, row in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="+Inf"}} {row[-1]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{key}"}} {row[-2]}')
+            lines.append(f'{self.name}_count{{{self.label}="{key}"}} {row[-1]}')
+        return lines
+
+class CallbackMetric:
+    """Gauge or counter read at scrape time from state kept elsewhere (queues, stats dicts)."""
+
+    def __init__(self, name: str, help: str, kind: str, fn):
+        self.name, self.help, self.kind, self.fn = name, help, kind, fn
+
+    def render(self) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            return []  # Component not started yet
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+STAGE_SECONDS = Histogram("sura_stage_seconds", "Time spent per pipeline stage", "stage")
+active_sessions = 0
+
+METRICS = [
+    STAGE_SECONDS,
+    CallbackMetric("sura_active_sessions", "Open interview WebSockets", "gauge", lambda: active_sessions),
+    CallbackMetric("sura_stt_queue_depth", "Utterances waiting for a Whisper replica", "gauge", lambda: stt_scheduler.depth()),
+    CallbackMetric("sura_feedback_queue_depth", "Feedback jobs waiting for a worker", "gauge", lambda: feedback_queue.depth()),
+    CallbackMetric("sura_llm_in_flight", "Gemini calls in progress", "gauge", lambda: llm_limiter.in_flight),
+    CallbackMetric("sura_tts_cache_hits_total", "TTS cache hits (memory and disk)", "counter",
+                   lambda: tts_cache.stats["memory_hits"] + tts_cache.stats["disk_hits"]),
+    CallbackMetric("sura_tts_cache_misses_total", "TTS cache misses", "counter", lambda: tts_cache.stats["misses"]),
+    CallbackMetric("sura_vad_clips_total", "Clips seen by the speech gate", "counter", lambda: speech_gate.stats["clips"]),
+    CallbackMetric("sura_vad_rejected_total", "Clips rejected by the speech gate", "counter", lambda: speech_gate.stats["rejected"]),
+    CallbackMetric("sura_prompt_tokens_total", "History tokens sent to Gemini", "counter", lambda: prompt_stats.total_tokens),
+    CallbackMetric("sura_sessions_waiting", "Sessions queued for admission", "gauge", lambda: len(governor.waiters)),
+    CallbackMetric("sura_sessions_rejected_total", "Sessions turned away at capacity", "counter",
+                   lambda: governor.stats["rejected"] + governor.stats["timed_out"]),
+    CallbackMetric("sura_load_shedding", "1 while replies are shortened and sent without TTS", "gauge",
+                   lambda: int(governor.shedding)),
+    CallbackMetric("sura_sessions_resumed_total", "Interviews resumed after a reconnect", "counter",
+                   lambda: session_stats["resumed"]),
+]
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+class SpanExporter:
+    """Appends finished spans to a JSONL file (OTLP/JSON span fields) from a background thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.spans = queue.SimpleQueue()
+        threading.Thread(target=self._write, name="trace-export", daemon=True).start()
+
+    def export(self, span: dict):
+        self.spans.put(span)
+
+    def _write(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                f.write(json.dumps(self.spans.get()) + "\n")
+                while not self.spans.empty():
+                    f.write(json.dumps(self.spans.get()) + "\n")
+                f.flush()
+
+span_exporter = SpanExporter(Config.TRACE_FILE) if Config.TRACE_FILE else None
+current_span = ContextVar("current_span", default=None)
+
+class Span:
+    """One timed stage. Always feeds STAGE_SECONDS; exported as a trace span when
+    tracing is on and it belongs to a sampled turn (root=True starts one)."""
+
+    def __init__(self, name: str, parent=None, root: bool = False, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.parent_id = parent.span_id if parent else ""
+        self.sampled = parent.sampled if parent else (root and span_exporter is not None
+                                                      and random.random() < Config.TRACE_SAMPLE_RATE)
+        self.trace_id = (parent.trace_id if parent else uuid.uuid4().hex) if self.sampled else ""
+        self.span_id = uuid.uuid4().hex[:16] if self.sampled else ""
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+
+    def end(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.name, elapsed)
+        if self.sampled:
+            span_exporter.export({
+                "traceId": self.trace_id, "spanId": self.span_id, "parentSpanId": self.parent_id,
+                "name": self.name, "kind": 1,
+                "startTimeUnixNano": self.start_ns, "endTimeUnixNano": self.start_ns + int(elapsed * 1e9),
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attributes.items()],
+            })
+        return elapsed
+
+def start_span(name: str, **attributes) -> Span:
+    """Span under the current one, for code that cannot use `with stage()` (async generators)."""
+    return Span(name, current_span.get(), **attributes)
+
+@contextmanager
+def stage(name: str, root: bool = False, **attributes):
+    """Times the block as a pipeline stage; spans opened inside become its children."""
+    span = Span(name, current_span.get(), root=root, **attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    finally:
+        current_span.reset(token)
+        span.end()
+
+# --- REDIS ---
+class RespClient:
+    """Minimal client for Redis (or anything speaking its protocol: Valkey, KeyDB, Dragonfly).
+
+    Speaks RESP over one asyncio connection, so no client library is needed;
+    the connection is reopened once if a command hits a dead socket.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.conn = None  # (reader, writer)
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _reply(self):
+        reader = self.conn[0]
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by Redis")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Redis error: {body.decode()}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(body)
+            return None if size < 0 else [await self._reply() for _ in range(size)]
+        raise ConnectionError(f"Unexpected Redis reply: {line[:32]!r}")
+
+    async def _send(self, *args):
+        self.conn[1].write(self._encode(args))
+        await self.conn[1].drain()
+        return await self._reply()
+
+    async def _open(self):
+        self.conn = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn[1].close()
+            self.conn = None
+
+    async def command(self, *args):
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        await asyncio.wait_for(self._open(), self.timeout)
+                    return await asyncio.wait_for(self._send(*args), self.timeout)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    await self.close()  # The reply stream is out of sync; start over
+                    if attempt:
+                        raise
+
+    async def subscribe(self, channel: str, handler):
+        """Calls handler(data) for each message published to channel. Runs until
+        cancelled on a connection of its own, reconnecting after errors."""
+        listener = RespClient(self.url, self.timeout)
+        while True:
+            try:
+                await asyncio.wait_for(listener._open(), self.timeout)
+                await asyncio.wait_for(listener._send("SUBSCRIBE", channel), self.timeout)
+                while True:
+                    reply = await listener._reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        await handler(reply[2])
+            except asyncio.CancelledError:
+                await listener.close()
+                raise
+            except Exception as e:
+                logger.error(f"Redis subscription to {channel} failed: {e!r}")
+                await listener.close()
+                await asyncio.sleep(1)
+
+# --- RESUME STORE ---
+class MemoryResumeStore:
+    """Per-process LRU of extracted resume text (by content hash) and session bindings."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.texts = OrderedDict()
+        self.sessions = OrderedDict()
+        self.jobs = OrderedDict()
+        self.handler = None
+
+    def _touch(self, table: OrderedDict, key, value=None):
+        if value is not None:
+            table[key] = value
+        elif key not in table:
+            return None
+        table.move_to_end(key)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+        return table[key]
+
+    async def get_text(self, digest: str):
+        return self._touch(self.texts, digest)
+
+    async def put_text(self, digest: str, text: str):
+        self._touch(self.texts, digest, text)
+
+    async def bind(self, session: str, digest: str):
+        self._touch(self.sessions, session, digest)
+
+    async def session_text(self, session: str):
+        digest = self._touch(self.sessions, session)
+        return await self.get_text(digest) if digest else None
+
+    async def get_job(self, job_id: str):
+        return self._touch(self.jobs, job_id)
+
+    async def put_job(self, job_id: str, job: dict):
+        self._touch(self.jobs, job_id, job)
+
+    async def publish(self, session: str, job: dict):
+        if self.handler is not None:
+            await self.handler(session, job)
+
+    async def subscribe(self, handler):
+        """handler(session, job) is called for each finished parse job (this process only)."""
+        self.handler = handler
+
+    async def close(self):
+        pass
+
+class SqliteResumeStore:
+    """Resume text and session bindings in a SQLite file shared by all workers on a host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS resume_text (digest TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS resume_session (session TEXT PRIMARY KEY, digest TEXT NOT NULL, updated REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS resume_job (id TEXT PRIMARY KEY, job TEXT NOT NULL, updated REAL NOT NULL)")
+        self.handler = None
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _query(self, sql: str, args: tuple):
+        with closing(self._connect()) as db, db:
+            row = db.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+    async def get_text(self, digest: str):
+        return await asyncio.to_thread(self._query, "SELECT text FROM resume_text WHERE digest = ?", (digest,))
+
+    async def put_text(self, digest: str, text: str):
+        await asyncio.to_thread(self._query, "INSERT OR IGNORE INTO resume_text VALUES (?, ?, ?)", (digest, text, time.time()))
+
+    async def bind(self, session: str, digest: str):
+        await asyncio.to_thread(self._query, "INSERT OR REPLACE INTO resume_session VALUES (?, ?, ?)", (session, digest, time.time()))
+
+    async def session_text(self, session: str):
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT t.text FROM resume_session s JOIN resume_text t ON t.digest = s.digest WHERE s.session = ?",
+            (session,)
+        )
+
+    async def get_job(self, job_id: str):
+        job = await asyncio.to_thread(self._query, "SELECT job FROM resume_job WHERE id = ?", (job_id,))
+        return json.loads(job) if job else None
+
+    async def put_job(self, job_id: str, job: dict):
+        await asyncio.to_thread(self._query, "INSERT OR REPLACE INTO resume_job VALUES (?, ?, ?)", (job_id, json.dumps(job), time.time()))
+
+    async def publish(self, session: str, job: dict):
+        if self.handler is not None:
+            await self.handler(session, job)
+
+    async def subscribe(self, handler):
+        """handler(session, job) is called for each finished parse job (this process only)."""
+        self.handler = handler
+
+    async def close(self):
+        pass
+
+class RedisResumeStore:
+    """Resume text, session bindings and parse jobs in Redis, shared by all hosts.
+
+    Finished jobs are published on a channel every worker subscribes to, so the
+    resume_ready push reaches a socket on any worker.
+    """
+
+    CHANNEL = "sura:resume_events"
+
+    def __init__(self, url: str, ttl: float):
+        self.redis = RespClient(url)
+        self.ttl = int(ttl)
+        self.listener = None
+
+    async def get_text(self, digest: str):
+        data = await self.redis.command("GET", f"sura:resume_text:{digest}")
+        return data.decode() if data is not None else None
+
+    async def put_text(self, digest: str, text: str):
+        await self.redis.command("SET", f"sura:resume_text:{digest}", text, "EX", self.ttl)
+
+    async def bind(self, session: str, digest: str):
+        await self.redis.command("SET", f"sura:resume_session:{session}", digest, "EX", self.ttl)
+
+    async def session_text(self, session: str):
+        digest = await self.redis.command("GET", f"sura:resume_session:{session}")
+        return await self.get_text(digest.decode()) if digest else None
+
+    async def get_job(self, job_id: str):
+        data = await self.redis.command("GET", f"sura:resume_job:{job_id}")
+        return json.loads(data) if data else None
+
+    async def put_job(self, job_id: str, job: dict):
+        await self.redis.command("SET", f"sura:resume_job:{job_id}", json.dumps(job), "EX", 3600)
+
+    async def publish(self, session: str, job: dict):
+        await self.redis.command("PUBLISH", self.CHANNEL, json.dumps({"session": session, "job": job}))
+
+    async def subscribe(self, handler):
+        """handler(session, job) is called for each finished parse job, on every worker."""
+        async def on_message(data):
+            event = json.loads(data)
+            await handler(event["session"], event["job"])
+        self.listener = asyncio.create_task(self.redis.subscribe(self.CHANNEL, on_message))
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.redis.close()
+
+def make_resume_store():
+    if Config.RESUME_STORE == "sqlite":
+        return SqliteResumeStore(Config.RESUME_STORE_PATH)
+    if Config.RESUME_STORE == "redis":
+        return RedisResumeStore(Config.RESUME_REDIS_URL, Config.RESUME_TTL_S)
+    return MemoryResumeStore(Config.RESUME_CACHE_SIZE)
+
+resume_store = make_resume_store()
+
+# --- RESUME RETRIEVAL ---
+RESUME_HEADING = re.compile(
+    r"^(summary|profile|objective|experience|work experience|employment|education|projects?|skills|"
+    r"technical skills|certifications?|achievements|awards|publications|internships?|activities)\b",
+    re.IGNORECASE
+)
+WORD = re.compile(r"[a-z0-9+#]+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+def tokenize(text: str) -> list:
+    return [w for w in WORD.findall(text.lower()) if len(w) > 1]
+
+def is_heading(line: str) -> bool:
+    if len(line) > 40:
+        return False
+    return bool(RESUME_HEADING.match(line)) or line.endswith(":") or (line.isupper() and any(c.isalpha() for c in line))
+
+def chunk_resume(text: str, max_chars: int) -> list:
+    """Splits a resume into sections at headings, capping each at max_chars."""
+    chunks, current = [], []
+    size = 0
+    for line in (l.strip() for l in text.splitlines()):
+        if not line:
+            continue
+        if current and (is_heading(line) or size + len(line) > max_chars):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+class ResumeIndex:
+    """BM25 over resume sections; picks the ones relevant to the conversation."""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, text: str, max_chars: int):
+        self.chunks = chunk_resume(text, max_chars)
+        self.terms = [Counter(tokenize(c)) for c in self.chunks]
+        self.lengths = [sum(t.values()) for t in self.terms]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        df = Counter(term for terms in self.terms for term in terms)
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def score(self, query: str) -> list:
+        words = [w for w in set(tokenize(query)) if w in self.idf]
+        scores = []
+        for terms, length in zip(self.terms, self.lengths):
+            norm = self.K1 * (1 - self.B + self.B * length / (self.avg_length or 1))
+            scores.append(sum(self.idf[w] * terms[w] * (self.K1 + 1) / (terms[w] + norm) for w in words if w in terms))
+        return scores
+
+    def select(self, query: str, top_k: int, token_budget: int) -> str:
+        """Top-k sections for query within token_budget, in document order.
+
+        With no matching terms (e.g. the first turn) the leading sections are used.
+        """
+        scores = self.score(query)
+        ranked = sorted(range(len(self.chunks)), key=lambda i: (-scores[i], i))
+        picked, used = [], 0
+        for i in ranked:
+            if len(picked) == top_k:
+                break
+            cost = estimate_tokens(self.chunks[i])
+            if used + cost > token_budget:
+                continue
+            picked.append(i)
+            used += cost
+        if not picked and self.chunks:
+            # Every section is over budget on its own: fall back to a clipped first one
+            return self.chunks[ranked[0]][:token_budget * 4]
+        return "\n...\n".join(self.chunks[i] for i in sorted(picked))
+
+@lru_cache(maxsize=64)
+def resume_index(resume: str) -> ResumeIndex:
+    return ResumeIndex(resume, Config.RESUME_CHUNK_CHARS)
+
+def resume_context(resume: str, query: str) -> str:
+    """Resume sections relevant to query, bounded by RESUME_TOKEN_BUDGET."""
+    if not resume:
+        return ""
+    return resume_index(resume).select(query, Config.RESUME_TOP_K, Config.RESUME_TOKEN_BUDGET)
+
+@lru_cache(maxsize=256)
+def build_system_prompt(role: str, resume: str, coding_completed: bool) -> str:
+    """Role prompt + resume block, built once per (role, resume sections, coding state)."""
+    system_prompt = INTERVIEW_PROMPTS.get(role, INTERVIEW_PROMPTS["general"])
+    if resume:
+        system_prompt += f"\n\nCANDIDATE RESUME (relevant sections):\n{resume}\n\nAsk specific questions about their resume."
+    system_prompt += f"\n\nCoding completed: {coding_completed}"
+    return system_prompt
 
 # --- SERVE STATIC FILES ---
 @app.get("/")
@@ -169,357 +804,2732 @@ async def get_config():
         }
     }
 
-@app.post("/upload_resume")
-async def upload_resume(file: UploadFile = File(...)):
-    global RESUME_CONTEXT
+@app.get("/api/tts_cache")
+async def get_tts_cache_stats():
+    """TTS cache hit rate and size, for sizing TTS_CACHE_MAX_BYTES"""
+    return tts_cache.snapshot()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage latencies, queue depths and cache counters"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/concept_cache")
+async def get_concept_cache():
+    """verify_concept cache, local index and Wikipedia lookup counts"""
+    return concept_lookup.snapshot()
+
+@app.get("/api/vad_stats")
+async def get_vad_stats():
+    """Clips rejected or trimmed by the speech gate and the Whisper time it saved"""
+    return speech_gate.snapshot()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving (models may still be loading)"""
+    return {"status": "ok", "uptime_s": round(time.monotonic() - STARTED_AT, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: questions loaded, Gemini client built and a Whisper replica warmed up; 503 until then"""
+    checks = {
+        "questions": QUESTION_BANK is not None,
+        "gemini": client is not None,
+        "whisper": stt_scheduler is not None and stt_scheduler.ready.is_set(),
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "starting",
+        "checks": checks,
+        "whisper_replicas": {"loaded": stt_scheduler.loaded, "failed": stt_scheduler.failed,
+                             "total": stt_scheduler.replicas} if stt_scheduler else None,
+        "errors": startup_errors,
+        "uptime_s": round(time.monotonic() - STARTED_AT, 1),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def admin_denied(x_admin_token: str):
+    """Error response unless the request carries ADMIN_TOKEN, None when allowed.
+
+    Endpoints guarded this way stay closed while ADMIN_TOKEN is unset.
+    """
+    if not Config.ADMIN_TOKEN:
+        return JSONResponse({"status": "error", "message": "Disabled, ADMIN_TOKEN is not set"}, status_code=403)
+    if not x_admin_token:
+        return JSONResponse({"status": "error", "message": "Missing X-Admin-Token"}, status_code=401)
+    if not secrets.compare_digest(x_admin_token, Config.ADMIN_TOKEN):
+        return JSONResponse({"status": "error", "message": "Forbidden"}, status_code=403)
+    return None
+
+class GovernorLimits(BaseModel):
+    """Body of POST /api/admin/governor; omitted fields keep their value"""
+    max_sessions: Optional[int] = Field(None, ge=0, le=100_000)  # 0 = unlimited
+    shed_queue_ms: Optional[float] = Field(None, ge=0, le=600_000)  # 0 = never shed
+
+@app.get("/api/admin/governor")
+async def get_governor(x_admin_token: str = Header(None)):
+    """Admission, per-stage caps, queue waits and load shedding state"""
+    if denied := admin_denied(x_admin_token):
+        return denied
+    return governor.snapshot()
+
+@app.post("/api/admin/governor")
+async def update_governor(limits: GovernorLimits, x_admin_token: str = Header(None)):
+    """Adjusts max_sessions / shed_queue_ms at runtime (this worker only)"""
+    if denied := admin_denied(x_admin_token):
+        return denied
+    if limits.max_sessions is not None:
+        governor.max_sessions = limits.max_sessions
+        governor.wake()
+    if limits.shed_queue_ms is not None:
+        governor.shed_queue_ms = limits.shed_queue_ms
+    return governor.snapshot()
+
+@app.get("/api/session_stats")
+async def get_session_stats():
+    """Session saves, resumes after a reconnect and unknown/expired resume attempts"""
+    return {"store": Config.SESSION_STORE, **session_stats}
+
+@app.get("/api/prompt_stats")
+async def get_prompt_stats():
+    """History tokens sent per turn and prompt cache use, for sizing HISTORY_TOKEN_BUDGET"""
+    stats = prompt_stats.snapshot()
+    if prompt_cache is not None:
+        stats["prompt_cache"] = prompt_cache.stats
+    return stats
+
+def _pdf_timeout(signum, frame):
+    raise TimeoutError("PDF extraction timed out")
+
+def extract_pdf_text(contents: bytes, max_pages: int, timeout_s: int) -> str:
+    """Extracts text from the first max_pages pages. Runs in a worker process."""
+    signal.signal(signal.SIGALRM, _pdf_timeout)
+    signal.alarm(timeout_s)  # Abort inside the worker so it stays reusable
     try:
-        contents = await file.read()
         pdf_reader = pypdf.PdfReader(io.BytesIO(contents))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        RESUME_CONTEXT = text.strip()
-        logger.info(f"📄 Resume uploaded. Length: {len(RESUME_CONTEXT)} chars")
-        return {"status": "success", "length": len(RESUME_CONTEXT)}
+        pages = [page.extract_text() or "" for page in pdf_reader.pages[:max_pages]]
+        return "\n".join(pages).strip()
+    finally:
+        signal.alarm(0)
+
+pdf_pool = None
+background_tasks = set()  # Fire-and-forget tasks, referenced until they finish
+session_listeners = defaultdict(set)  # session token -> callbacks of sockets connected to this worker
+
+def run_in_background(coro) -> asyncio.Task:
+    """create_task that keeps a reference, so the task is not garbage collected mid-run."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global pdf_pool
+    if pdf_pool is None:
+        # Not fork: this process already runs STT, feedback and trace threads
+        pdf_pool = ProcessPoolExecutor(max_workers=Config.PDF_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return pdf_pool
+
+async def parse_resume_job(job_id: str, session: str, digest: str, contents: bytes):
+    job = {"status": "processing", "session": session}
+    try:
+        text = await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(
+                get_pdf_pool(), extract_pdf_text, contents, Config.RESUME_MAX_PAGES, int(Config.PDF_TIMEOUT_S)
+            ),
+            Config.PDF_TIMEOUT_S + 5
+        )
+        await resume_store.put_text(digest, text)
+        await resume_store.bind(session, digest)
+        resume_index(text)  # Chunk and index now rather than on the first turn
+        job.update(status="success", length=len(text))
+        logger.info(f"📄 Resume parsed. Length: {len(text)} chars")
+    except Exception as e:
+        logger.error(f"Resume parsing failed: {e!r}")
+        job.update(status="error", message=str(e) or type(e).__name__)
+    # Sockets of this session (on any worker sharing the store) are told either way, so none waits forever
+    try:
+        await resume_store.put_job(job_id, job)
+        await resume_store.publish(session, job)
+    except Exception as e:
+        logger.error(f"Resume job update failed: {e!r}")
+
+async def dispatch_resume_event(session: str, job: dict):
+    """Forwards a finished parse job to the sockets of its session on this worker."""
+    for notify in list(session_listeners.get(session, ())):
+        await notify(job)
+
+@app.post("/upload_resume")
+async def upload_resume(file: UploadFile = File(...), session: str = Form(None)):
+    """Stores the resume for a session; the returned token is passed to /ws?session=...
+
+    Known files are bound immediately. New ones are parsed in a process pool and
+    the response carries a job id; the result can be polled or arrives on /ws as
+    a resume_ready message.
+    """
+    session = session or uuid.uuid4().hex
+    try:
+        contents = await file.read(Config.RESUME_MAX_BYTES + 1)
+        if len(contents) > Config.RESUME_MAX_BYTES:
+            return {"status": "error", "message": f"Resume larger than {Config.RESUME_MAX_BYTES // (1024 * 1024)} MB"}
+        digest = hashlib.sha256(contents).hexdigest()
+        text = await resume_store.get_text(digest)
+        if text is not None:
+            await resume_store.bind(session, digest)
+            logger.info(f"📄 Resume uploaded (cached). Length: {len(text)} chars")
+            return {"status": "success", "length": len(text), "session": session, "cached": True}
+
+        job_id = uuid.uuid4().hex
+        await resume_store.put_job(job_id, {"status": "processing", "session": session})
+        run_in_background(parse_resume_job(job_id, session, digest, contents))
+        return {"status": "processing", "job_id": job_id, "session": session}
     except Exception as e:
         logger.error(f"Resume upload failed: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/feedback/jobs/{job_id}")
+async def get_feedback_job(job_id: str):
+    """Status and result of a feedback job, for clients that missed the /ws push"""
+    return feedback_queue.get(job_id) or {"status": "error", "message": "Unknown job"}
+
+@app.get("/api/feedback")
+async def list_feedback(limit: int = 20, before: float = None, role: str = None, x_admin_token: str = Header(None)):
+    """Feedback report summaries, newest first. Page with ?before=<next_before>."""
+    if denied := admin_denied(x_admin_token):
+        return denied
+    reports = await feedback_store.list(max(1, min(limit, 100)), before, role)
+    return {"reports": reports, "next_before": reports[-1]["created"] if reports else None}
+
+@app.get("/api/feedback/{report_id}")
+async def get_feedback(report_id: str, x_admin_token: str = Header(None)):
+    """Full feedback report with its transcript"""
+    if denied := admin_denied(x_admin_token):
+        return denied
+    return await feedback_store.get(report_id) or {"status": "error", "message": "Unknown report"}
+
+@app.get("/upload_resume/{job_id}")
+async def get_resume_job(job_id: str):
+    return await resume_store.get_job(job_id) or {"status": "error", "message": "Unknown job"}
+
 # --- TOOLS ---
 
+class QuestionBank:
+    """Coding problems indexed by id, difficulty and tag.
+
+    The indexes are built once per load, so lookups and random picks from a
+    bucket are O(1) however large the bank grows.
+    """
+
+    def __init__(self, problems=(), path: str = None, mtime: float = None):
+        self.problems = list(problems)
+        self.path = path
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        self.by_id = {str(p.get("id")): p for p in self.problems}
+        self.by_difficulty = defaultdict(list)
+        self.by_tag = defaultdict(list)
+        for p in self.problems:
+            self.by_difficulty[p.get("difficulty")].append(p)
+            for tag in p.get("tags", []):
+                self.by_tag[tag].append(p)
+
+    def __len__(self):
+        return len(self.problems)
+
+    def __iter__(self):
+        return iter(self.problems)
+
+    def get(self, problem_id):
+        return self.by_id.get(str(problem_id))
+
+    def random(self, difficulty: str = None, tag: str = None):
+        """Random problem from the matching bucket, or from the whole bank if it is empty."""
+        if difficulty and tag:
+            bucket = [p for p in self.by_tag.get(tag, []) if p.get("difficulty") == difficulty]
+        elif difficulty:
+            bucket = self.by_difficulty.get(difficulty)
+        elif tag:
+            bucket = self.by_tag.get(tag)
+        else:
+            bucket = None
+        return random.choice(bucket or self.problems) if self.problems else None
+
 def load_questions(filepath: str = Config.QUESTIONS_FILE):
     global QUESTION_BANK
     if not os.path.exists(filepath):
-        QUESTION_BANK = []
+        QUESTION_BANK = QuestionBank(path=filepath)
         return
     try:
+        mtime = os.path.getmtime(filepath)
         with open(filepath, 'r') as f:
-            QUESTION_BANK = json.load(f)
-    except: QUESTION_BANK = []
+            QUESTION_BANK = QuestionBank(json.load(f), filepath, mtime)
+        logger.info(f"📚 Loaded {len(QUESTION_BANK)} questions from {filepath}")
+    except Exception as e:
+        logger.error(f"Could not load questions: {e}")
+        if not QUESTION_BANK:
+            QUESTION_BANK = QuestionBank(path=filepath)
+
+def get_question_bank() -> QuestionBank:
+    """The current bank, reloaded when the questions file changes on disk."""
+    bank = QUESTION_BANK
+    if bank is None:
+        load_questions()
+        return QUESTION_BANK
+    now = time.monotonic()
+    if now - bank.checked >= Config.QUESTIONS_RELOAD_INTERVAL_S:
+        bank.checked = now
+        try:
+            mtime = os.path.getmtime(bank.path)
+        except OSError:
+            mtime = None
+        if mtime != bank.mtime:
+            load_questions(bank.path)
+    return QUESTION_BANK
 
 def get_random_problem():
     """Returns a random easy coding problem with test cases."""
-    if not QUESTION_BANK: load_questions()
-    if not QUESTION_BANK: return json.dumps({"error": "No questions"})
-    # Filter for easy problems only
-    easy_problems = [p for p in QUESTION_BANK if p.get("difficulty") == "easy"]
-    if not easy_problems: easy_problems = QUESTION_BANK  # Fallback
-    p = random.choice(easy_problems)
-    return json.dumps({
-        "id": str(p.get("id", "0")), 
-        "title": p.get("title", ""), 
-        "description": p.get("description", ""), 
-        "starter_code": p.get("signature", ""),
-        "test_cases": p.get("test_cases", [])
+    with stage("tool.get_random_problem"):
+        bank = get_question_bank()
+        if not bank: return json.dumps({"error": "No questions"})
+        p = bank.random(difficulty="easy")
+        return json.dumps({
+            "id": str(p.get("id", "0")), 
+            "title": p.get("title", ""), 
+            "description": p.get("description", ""), 
+            "starter_code": p.get("signature", ""),
+            "test_cases": p.get("test_cases", [])
+        })
+
+wiki_http = None
+
+def get_wiki_http() -> httpx.AsyncClient:
+    """Shared keep-alive client for the Wikipedia API."""
+    global wiki_http
+    if wiki_http is None:
+        wiki_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(Config.CONCEPT_TIMEOUT_S, connect=5.0),
+            headers={"User-Agent": "SURA-interview/1.0 (verify_concept)"},
+        )
+    return wiki_http
+
+async def fetch_concept(topic: str, sentences: int = 3):
+    """(title, summary) of the best Wikipedia match for topic, or None.
+
+    One request: search results come back with their intro extracts, and
+    disambiguation pages are skipped.
+    """
+    resp = await get_wiki_http().get(Config.WIKI_API_URL, params={
+        "action": "query", "format": "json", "formatversion": "2", "redirects": "1",
+        "generator": "search", "gsrsearch": topic, "gsrlimit": "3",
+        "prop": "extracts|pageprops", "ppprop": "disambiguation",
+        "exintro": "1", "explaintext": "1", "exsentences": str(sentences), "exlimit": "3",
     })
+    resp.raise_for_status()
+    pages = sorted(resp.json().get("query", {}).get("pages", []), key=lambda p: p.get("index", 0))
+    for page in pages:
+        if page.get("extract") and "disambiguation" not in page.get("pageprops", {}):
+            return page["title"], page["extract"].strip()
+    return None
 
-def verify_concept(topic: str):
+class ConceptIndex:
+    """Read-only SQLite FTS5 index of concept summaries, built by build_concept_index.py."""
+
+    SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS concepts USING fts5(topic, title, summary, tokenize='porter unicode61')"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def build(cls, path: str, rows: list):
+        """Writes (topic, title, summary) rows to a fresh index at path."""
+        with closing(sqlite3.connect(path)) as db, db:
+            db.execute("DROP TABLE IF EXISTS concepts")
+            db.execute(cls.SCHEMA)
+            db.executemany("INSERT INTO concepts VALUES (?, ?, ?)", rows)
+
+    def search(self, topic: str):
+        """(title, summary) whose topic or title matches every word of topic, best first; None on a miss."""
+        words = re.findall(r"\w+", topic.lower())
+        if not words: return None
+        with closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)) as db:
+            row = db.execute("SELECT title, summary FROM concepts WHERE lower(topic) = ? OR lower(title) = ? LIMIT 1",
+                             (" ".join(words), topic.lower().strip())).fetchone()
+            if row is None:
+                query = "{topic title} : (" + " ".join(f'"{w}"' for w in words) + ")"
+                row = db.execute("SELECT title, summary FROM concepts WHERE concepts MATCH ? "
+                                 "ORDER BY bm25(concepts, 10.0, 5.0, 1.0) LIMIT 1", (query,)).fetchone()
+        return row
+
+class ConceptLookup:
+    """verify_concept backend: TTL/LRU cache, then the local index, then Wikipedia.
+
+    Concurrent lookups of the same topic share one fetch. Failed network
+    lookups are not cached, so the next call retries them.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, index_path: str = "", network: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index = ConceptIndex(index_path) if index_path else None
+        self.network = network
+        self.entries = OrderedDict()  # key -> (expires, text)
+        self.inflight = {}
+        self.stats = {"hits": 0, "index_hits": 0, "network": 0, "not_found": 0, "errors": 0}
+
+    @staticmethod
+    def key(topic: str) -> str:
+        return " ".join(topic.lower().split())
+
+    def _remember(self, key: str, text: str):
+        self.entries[key] = (time.monotonic() + self.ttl, text)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, topic: str) -> str:
+        key = self.key(topic)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        future = self.inflight.get(key)
+        if future is None:
+            future = self.inflight[key] = asyncio.ensure_future(self._resolve(topic, key))
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _resolve(self, topic: str, key: str) -> str:
+        found = None
+        if self.index is not None:
+            try:
+                found = await asyncio.to_thread(self.index.search, topic)
+            except Exception as e:
+                logger.warning(f"Concept index lookup failed: {e}")
+            if found:
+                self.stats["index_hits"] += 1
+        if found is None and self.network:
+            self.stats["network"] += 1
+            try:
+                found = await fetch_concept(topic)
+            except Exception as e:
+                logger.warning(f"Wikipedia lookup failed for {topic!r}: {e!r}")
+                self.stats["errors"] += 1
+                return "Could not verify."
+        if found is None:
+            self.stats["not_found"] += 1
+            text = "No Wikipedia page found."
+        else:
+            text = f"Fact Check:\n{found[1]}"
+        self._remember(key, text)
+        return text
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self.entries), "index": self.index.path if self.index else None, **self.stats}
+
+concept_lookup = ConceptLookup(Config.CONCEPT_CACHE_SIZE, Config.CONCEPT_CACHE_TTL_S,
+                               Config.CONCEPT_INDEX_PATH, Config.CONCEPT_NETWORK_FALLBACK)
+
+async def verify_concept(topic: str):
     """Verifies a technical concept using Wikipedia."""
+    with stage("tool.verify_concept"):
+        return await concept_lookup.get(topic)
+
+piston_http = None
+
+def get_piston_http() -> httpx.AsyncClient:
+    """Shared keep-alive client for the code execution API."""
+    global piston_http
+    if piston_http is None:
+        piston_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(Config.PISTON_TIMEOUT_S, connect=5.0),
+            limits=httpx.Limits(max_connections=Config.PISTON_MAX_CONNECTIONS,
+                                max_keepalive_connections=Config.PISTON_MAX_CONNECTIONS),
+        )
+    return piston_http
+
+async def execute_piston(script: str):
     try:
-        res = wikipedia.search(topic)
-        if not res: return "No Wikipedia page found."
-        summary = wikipedia.summary(res[0], sentences=3)
-        return f"Fact Check:\n{summary}"
-    except: return "Could not verify."
+        resp = await get_piston_http().post(Config.PISTON_API_URL, json={"language": "python", "version": "3.10.0", "files": [{"content": script}]})
+        return resp.json()
+    except Exception as e:
+        logger.error(f"Code execution error: {e!r}")
+        return None
 
-def execute_piston(script: str):
+LOCAL_BOOTSTRAP = """
+import ctypes, os, platform, resource, signal, sys
+def _limit(res, soft, hard=None):
     try:
-        resp = requests.post(Config.PISTON_API_URL, json={"language": "python", "version": "3.10.0", "files": [{"content": script}]}).json()
-        return resp
-    except: return None
+        resource.setrlimit(res, (soft, soft if hard is None else hard))
+    except (ValueError, OSError):
+        pass
+def _isolate():
+    # New user, mount, network and PID namespaces, then pivot_root into the per-run
+    # workdir with only the standard library and shared libraries bound read-only.
+    libc = ctypes.CDLL(None, use_errno=True)
+    def check(ret, what):
+        if ret != 0:
+            raise OSError(ctypes.get_errno(), f"{{what}}: {{os.strerror(ctypes.get_errno())}}")
+    def mount(src, dst, flags):
+        check(libc.mount(src and src.encode(), dst.encode(), None, flags, None), f"mount {{dst}}")
+    root, uid, gid = os.getcwd(), os.getuid(), os.getgid()
+    check(libc.unshare(0x10000000 | 0x00020000 | 0x40000000 | 0x20000000), "unshare")  # NEWUSER | NEWNS | NEWNET | NEWPID
+    for name, data in (("setgroups", "deny"), ("uid_map", f"0 {{uid}} 1"), ("gid_map", f"0 {{gid}} 1")):
+        with open(f"/proc/self/{{name}}", "w") as f:
+            f.write(data)
+    mount(None, "/", 0x40000 | 0x4000)  # MS_PRIVATE | MS_REC
+    mount(root, root, 0x1000)  # MS_BIND: pivot_root needs a mount point
+    binds = [p for p in sys.path if os.path.isdir(p)]
+    binds += [p for p in ("/lib", "/lib64", "/usr/lib", "/usr/lib64") if os.path.isdir(p) and not os.path.islink(p)]
+    for src in binds:
+        dst = root + src
+        os.makedirs(dst, exist_ok=True)
+        mount(src, dst, 0x1000 | 0x4000)  # MS_BIND | MS_REC
+        # Read-only remount; the source's nosuid/nodev/noexec/atime flags are locked and must be kept
+        mount(None, dst, 0x1000 | 0x20 | 0x1 | (os.statvfs(src).f_flag & 0x1c0e))
+    os.makedirs(root + "/tmp", exist_ok=True)
+    os.chdir(root)
+    check(libc.syscall({{"x86_64": 155, "aarch64": 41}}[platform.machine()], b".", b"."), "pivot_root")
+    check(libc.umount2(b".", 2), "umount old root")  # MNT_DETACH
+    os.chdir("/")
+    # Drop every capability held in the new user namespace
+    header = (ctypes.c_uint32 * 2)(0x20080522, 0)
+    check(libc.capset(header, (ctypes.c_uint32 * 6)()), "capset")
+    check(libc.prctl(38, 1, 0, 0, 0), "no_new_privs")  # PR_SET_NO_NEW_PRIVS
+    # The submission runs as PID 1 of the new PID namespace: when it exits or is
+    # killed, every process it forked is killed with it. This process only waits
+    # and mirrors its exit status.
+    pid = os.fork()
+    if pid:
+        code = os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+        if code < 0:
+            if -code != signal.SIGKILL:
+                signal.signal(-code, signal.SIG_DFL)
+            os.kill(os.getpid(), -code)
+        os._exit(code)
+_limit(resource.RLIMIT_CPU, {cpu_s}, {cpu_s} + 1)  # Soft limit is ignored by PID 1 of the namespace; SIGKILL a second later
+_limit(resource.RLIMIT_AS, {memory_mb} * 1024 * 1024)
+_limit(resource.RLIMIT_FSIZE, 1024 * 1024)
+_limit(resource.RLIMIT_NOFILE, 64)
+_limit(resource.RLIMIT_CORE, 0)
+try:
+    _isolate()
+except Exception as e:
+    # Never run a submission without the filesystem and network isolation
+    sys.stderr.write(f"Sandbox setup failed: {{e}}\\n")
+    sys.stderr.flush()
+    os._exit(125)
+_limit(resource.RLIMIT_NPROC, 0)
+_src = sys.stdin.read()
+del ctypes, os, platform, resource, signal, _limit, _isolate
+exec(compile(_src, "<submission>", "exec"), {{"__name__": "__main__"}})
+"""
+
+class LocalExecutor:
+    """Runs submissions in pre-forked, resource-limited local Python processes.
+
+    Each worker is an isolated interpreter (-I -S) that has already started,
+    applied its rlimits, entered fresh user/mount/net/PID namespaces and pivoted
+    into its own workdir (only the standard library and shared libraries are
+    visible, read-only), and is blocked reading its script from stdin. A worker
+    that cannot set up that isolation exits without running anything. A worker
+    runs exactly one script and its whole process group is then killed, so
+    nothing it forked survives; it is replaced in the background.
+    """
+
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self.idle = asyncio.Queue()
+        self.bootstrap = LOCAL_BOOTSTRAP.format(cpu_s=Config.CODE_CPU_LIMIT_S, memory_mb=Config.CODE_MEMORY_MB)
+
+    async def start(self):
+        # Refuse to run submissions at all unless the sandbox really hides the server's files
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        probe = await self.run(f"import os\nprint(os.path.exists({app_dir!r}))")
+        if not probe or probe["run"]["code"] != 0 or probe["run"]["stdout"].strip() != "False":
+            detail = probe["run"]["stderr"].strip() if probe else "worker did not start"
+            raise RuntimeError(f"Local code executor disabled, sandbox isolation unavailable: {detail}")
+        await asyncio.gather(*(self._replenish() for _ in range(self.pool_size)))
+        logger.info(f"🐍 Local code executor ready ({self.pool_size} warm workers)")
+
+    async def _spawn(self):
+        workdir = tempfile.mkdtemp(prefix="sura-run-")
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", "-S", "-c", self.bootstrap,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            cwd=workdir, env={"PATH": "/usr/bin:/bin", "LANG": "C.UTF-8"}, start_new_session=True,
+        )
+        return proc, workdir
 
-def run_playground_code(user_code: str):
+    async def _replenish(self):
+        try:
+            await self.idle.put(await self._spawn())
+        except Exception as e:
+            logger.error(f"Could not spawn code worker: {e!r}")
+
+    async def _acquire(self):
+        while not self.idle.empty():
+            proc, workdir = self.idle.get_nowait()
+            run_in_background(self._replenish())
+            if proc.returncode is None:
+                return proc, workdir
+            shutil.rmtree(workdir, ignore_errors=True)
+        return await self._spawn()
+
+    @staticmethod
+    async def _read_capped(stream, limit: int) -> bytes:
+        data = bytearray()
+        while chunk := await stream.read(65536):
+            data += chunk
+            if len(data) > limit:
+                raise OverflowError
+        return bytes(data)
+
+    @staticmethod
+    def _kill_group(proc):
+        """SIGKILLs the worker and anything it started (its own session, see _spawn)."""
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def run(self, script: str) -> dict:
+        proc, workdir = await self._acquire()
+        limit = Config.CODE_OUTPUT_LIMIT
+        stderr_note = ""
+
+        async def exited():
+            # Leftover processes holding the pipes must not keep the reads open
+            await proc.wait()
+            self._kill_group(proc)
+
+        try:
+            proc.stdin.write(script.encode())
+            await proc.stdin.drain()
+            proc.stdin.close()
+            out, err, _ = await asyncio.wait_for(asyncio.gather(
+                self._read_capped(proc.stdout, limit), self._read_capped(proc.stderr, limit), exited()
+            ), Config.CODE_WALL_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            out, err, stderr_note = b"", b"", "Time limit exceeded"
+        except OverflowError:
+            out, err, stderr_note = b"", b"", "Output limit exceeded"
+        except Exception as e:
+            logger.error(f"Local execution error: {e!r}")
+            return None
+        finally:
+            self._kill_group(proc)
+            if proc.returncode is None:
+                await proc.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+        stdout = out.decode(errors="replace")
+        stderr = err.decode(errors="replace")
+        if stderr_note:
+            stderr = f"{stderr}\n{stderr_note}".strip()
+        signal_name = None
+        if proc.returncode is not None and proc.returncode < 0:
+            signal_name = signal.Signals(-proc.returncode).name
+            if signal_name in ("SIGXCPU", "SIGKILL") and not stderr_note:
+                stderr = f"{stderr}\nCPU time limit exceeded".strip()
+        return {"run": {"stdout": stdout, "stderr": stderr, "output": stdout + stderr,
+                        "code": proc.returncode, "signal": signal_name}}
+
+    async def close(self):
+        while not self.idle.empty():
+            proc, workdir = self.idle.get_nowait()
+            self._kill_group(proc)
+            if proc.returncode is None:
+                await proc.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+local_executor = LocalExecutor(Config.CODE_POOL_SIZE)
+
+async def execute_code(script: str):
+    """Runs a Python script on the configured backend and returns a Piston-shaped response."""
+    with stage("execute_code", backend=Config.CODE_EXECUTOR):
+        if Config.CODE_EXECUTOR == "local":
+            return await local_executor.run(script)
+        return await execute_piston(script)
+
+async def run_playground_code(user_code: str):
     """Runs code without test cases."""
-    resp = execute_piston(user_code)
+    resp = await execute_code(user_code)
     if not resp: return "Network Error"
     out = resp.get("run", {}).get("stdout", "")
     err = resp.get("run", {}).get("stderr", "")
     return (out + "\n" + err).strip()
 
-def submit_code(problem_id: str, user_code: str):
+HARNESS_TEMPLATE = """
+import contextlib, io, json, traceback
+_results = []
+_solution, _compile_err = None, ""
+try:
+    _solution = compile({user_code!r}, "<solution>", "exec")
+except BaseException:
+    _compile_err = traceback.format_exc()
+for _code in {tests!r}:
+    _out, _err = io.StringIO(), _compile_err
+    if not _compile_err:
+        _globals = {{"__name__": "__main__"}}
+        try:
+            with contextlib.redirect_stdout(_out):
+                exec(_solution, _globals)
+                exec(compile(_code, "<test>", "exec"), _globals)
+        except BaseException:
+            _err = traceback.format_exc()
+    _results.append({{"stdout": _out.getvalue(), "stderr": _err}})
+print({sentinel!r} + json.dumps(_results))
+"""
+
+def build_test_harness(user_code: str, tests: list, sentinel: str) -> str:
+    """One script that runs every test against a fresh run of the solution.
+
+    The solution is compiled once but executed into new globals for each test,
+    so each test sees the solution's top-level stdout followed by its own and no
+    state left by earlier tests, as if "solution + test" ran as its own program.
+    """
+    return HARNESS_TEMPLATE.format(user_code=user_code, tests=[t["input_code"] for t in tests], sentinel=sentinel)
+
+async def run_tests_batched(user_code: str, tests: list):
+    """Runs all tests in a single sandbox invocation; None if the harness did not report."""
+    sentinel = f"__SURA_RESULTS_{uuid.uuid4().hex}__"
+    resp = await execute_code(build_test_harness(user_code, tests, sentinel))
+    if not resp or "run" not in resp: return None
+    for line in reversed(resp["run"].get("stdout", "").splitlines()):
+        if line.startswith(sentinel):
+            try:
+                results = json.loads(line[len(sentinel):])
+            except ValueError:
+                return None
+            return results if len(results) == len(tests) else None
+    return None  # exit(), timeout or crash before the report
+
+async def run_tests_parallel(user_code: str, tests: list):
+    """Runs each test as its own program, all concurrently."""
+    resps = await asyncio.gather(*(execute_code(f"{user_code}\n\n{test['input_code']}") for test in tests))
+    return [resp.get("run") if resp and "run" in resp else None for resp in resps]
+
+async def submit_code(problem_id: str, user_code: str):
     """Runs user code against test cases."""
-    if not QUESTION_BANK: load_questions()
-    problem = next((p for p in QUESTION_BANK if str(p["id"]) == str(problem_id)), None)
+    problem = get_question_bank().get(problem_id)
     if not problem: return "Invalid Problem ID."
     
+    tests = problem.get("test_cases", [])
+    runs = await run_tests_batched(user_code, tests) if Config.CODE_BATCH_TESTS and tests else None
+    if runs is None:
+        runs = await run_tests_parallel(user_code, tests)
+
     results = []
-    for i, test in enumerate(problem.get("test_cases", []), 1):
-        script = f"{user_code}\n\n{test['input_code']}"
-        resp = execute_piston(script)
-        if resp and "run" in resp and resp["run"]["stdout"].strip() == test["expected"].strip():
+    for i, (test, run) in enumerate(zip(tests, runs), 1):
+        if run and run.get("stdout", "").strip() == test["expected"].strip():
             results.append(f"Test {i}: PASSED")
         else:
-            err = resp.get("run", {}).get("stderr", "") if resp else "Network Error"
+            err = run.get("stderr", "") if run else "Network Error"
             results.append(f"Test {i}: FAILED {err}")
     return "\n".join(results)
 
-# --- FEEDBACK GENERATION ---
-def generate_feedback(history: list, role: str) -> dict:
-    """Generate interview feedback based on conversation history and role."""
-    try:
-        # Create a prompt for feedback generation
-        feedback_prompt = f"""Analyze this {role.replace('_', ' ')} interview and provide detailed, comprehensive feedback.
+# --- RESOURCE GOVERNOR ---
+SHED_NOTE = "[SYSTEM: The service is under heavy load. Reply in one short sentence.]"
 
-Interview Transcript:
-{json.dumps(history, indent=2)}
+class TokenBucket:
+    """Non-blocking token bucket: allow() spends a token when one is available."""
 
-Provide feedback in the following JSON format:
-{{
-    "overall_score": <1-10>,
-    "communication": {{"score": <1-10>, "feedback": "..."}},
-    "technical_knowledge": {{"score": <1-10>, "feedback": "..."}},
-    "problem_solving": {{"score": <1-10>, "feedback": "..."}},
-    "strengths": ["strength1", "strength2", "strength3"],
-    "improvements": ["area1", "area2", "area3"],
-    "summary": "Overall assessment..."
-}}
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate = rate_per_sec
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
 
-Be specific, constructive, and actionable. Provide detailed feedback."""
+    def allow(self) -> bool:
+        if self.rate <= 0: return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
 
-        resp = client.models.generate_content(
-            model=Config.MODEL_ID,
-            contents=feedback_prompt
-        )
-        
-        # Parse JSON from response
-        feedback_text = resp.text
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', feedback_text, re.DOTALL)
-        if json_match:
-            feedback_data = json.loads(json_match.group())
-        else:
-            feedback_data = {
-                "overall_score": 7,
-                "communication": {"score": 7, "feedback": "Good communication throughout"},
-                "technical_knowledge": {"score": 7, "feedback": "Demonstrated knowledge"},
-                "problem_solving": {"score": 7, "feedback": "Approached problems logically"},
-                "strengths": ["Clear communication", "Good attitude"],
-                "improvements": ["More specific examples", "Deeper technical details"],
-                "summary": "Overall solid performance in the interview."
-            }
-        
-        # Save feedback to file
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"interview_feedback_{role}_{timestamp}.txt"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("=" * 60 + "\n")
-            f.write(f"INTERVIEW FEEDBACK - {role.replace('_', ' ').upper()}\n")
-            f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 60 + "\n\n")
-            
-            f.write(f"OVERALL SCORE: {feedback_data['overall_score']}/10\n\n")
-            
-            f.write("DETAILED SCORES:\n")
-            f.write(f"  • Communication: {feedback_data['communication']['score']}/10\n")
-            f.write(f"    {feedback_data['communication']['feedback']}\n\n")
-            f.write(f"  • Technical Knowledge: {feedback_data['technical_knowledge']['score']}/10\n")
-            f.write(f"    {feedback_data['technical_knowledge']['feedback']}\n\n")
-            f.write(f"  • Problem Solving: {feedback_data['problem_solving']['score']}/10\n")
-            f.write(f"    {feedback_data['problem_solving']['feedback']}\n\n")
-            
-            f.write("STRENGTHS:\n")
-            for i, strength in enumerate(feedback_data['strengths'], 1):
-                f.write(f"  {i}. {strength}\n")
-            f.write("\n")
-            
-            f.write("AREAS FOR IMPROVEMENT:\n")
-            for i, improvement in enumerate(feedback_data['improvements'], 1):
-                f.write(f"  {i}. {improvement}\n")
-            f.write("\n")
-            
-            f.write("SUMMARY:\n")
-            f.write(f"{feedback_data['summary']}\n\n")
-            
-            f.write("=" * 60 + "\n")
-            f.write("Full Interview Transcript:\n")
-            f.write("=" * 60 + "\n")
-            f.write(json.dumps(history, indent=2))
+class StageGate:
+    """Concurrency cap for one pipeline stage (0 = unlimited) that reports queue waits to the governor."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.perf_counter()
+        if self.semaphore is not None:
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        governor.record_wait(self.name, time.perf_counter() - start)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+class ResourceGovernor:
+    """Admission control and load shedding for this worker process.
+
+    Sessions beyond max_sessions wait in a FIFO of up to wait_queue entries and
+    are told their position; the rest are turned away. Capped stages (STT queue,
+    Gemini, TTS) report how long work waited for them. While the smoothed wait of
+    any stage is above shed_queue_ms, replies are shortened and sent without TTS,
+    until every stage is back under half the threshold.
+    """
+
+    def __init__(self, max_sessions: int, wait_queue: int, wait_timeout: float, shed_queue_ms: float):
+        self.max_sessions = max_sessions
+        self.wait_queue = wait_queue
+        self.wait_timeout = wait_timeout
+        self.shed_queue_ms = shed_queue_ms
+        self.active = 0
+        self.waiters = deque()  # Futures of queued sessions, oldest first
+        self.queue_wait = {}    # stage -> smoothed wait (s)
+        self.lock = threading.Lock()  # record_wait is also called from STT threads
+        self.shedding = False
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "shed_turns": 0, "audio_rate_limited": 0}
+
+    def _has_slot(self) -> bool:
+        return not self.max_sessions or self.active < self.max_sessions
+
+    async def admit(self, notify) -> bool:
+        """Takes a session slot, waiting in line if needed; False if the session was turned away.
+
+        notify(message) receives {"type": "queued", "position": n} while waiting.
+        """
+        if self._has_slot() and not self.waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return True
+        if len(self.waiters) >= self.wait_queue:
+            self.stats["rejected"] += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.stats["queued"] += 1
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while not future.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                await notify({"type": "queued", "position": self.waiters.index(future) + 1})
+                await asyncio.wait({future}, timeout=min(5.0, remaining))
+        except BaseException:
+            if future.done():
+                self.release()  # Granted just as we were cancelled
+            raise
+        finally:
+            if not future.done():
+                self.waiters.remove(future)
+                future.cancel()
+        if future.cancelled():
+            self.stats["timed_out"] += 1
+            return False
+        return True
+
+    def wake(self):
+        """Hands free slots to queued sessions (after a release or a raised limit)."""
+        while self.waiters and self._has_slot():
+            future = self.waiters.popleft()
+            if not future.done():
+                self.active += 1
+                self.stats["admitted"] += 1
+                future.set_result(True)
+
+    def release(self):
+        self.active -= 1
+        self.wake()
+
+    def record_wait(self, stage: str, seconds: float):
+        STAGE_SECONDS.observe(f"{stage}_queue", seconds)
+        with self.lock:
+            avg = self.queue_wait.get(stage, seconds)
+            self.queue_wait[stage] = avg + 0.2 * (seconds - avg)
+            worst_ms = max(self.queue_wait.values()) * 1000
+        if self.shed_queue_ms <= 0:
+            self.shedding = False
+        elif not self.shedding and worst_ms > self.shed_queue_ms:
+            logger.warning(f"⚠️ Load shedding on: {stage} queue wait ~{worst_ms:.0f} ms")
+            self.shedding = True
+        elif self.shedding and worst_ms < self.shed_queue_ms / 2:
+            logger.info("✅ Load shedding off")
+            self.shedding = False
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            queue_wait = {k: round(v * 1000, 1) for k, v in self.queue_wait.items()}
+        return {
+            "max_sessions": self.max_sessions,
+            "active_sessions": self.active,
+            "waiting_sessions": len(self.waiters),
+            "wait_queue": self.wait_queue,
+            "shedding": self.shedding,
+            "shed_queue_ms": self.shed_queue_ms,
+            "queue_wait_ms": queue_wait,
+            "stages": {
+                "stt": {"replicas": stt_scheduler.replicas if stt_scheduler else 0,
+                        "queued": stt_scheduler.depth() if stt_scheduler else 0,
+                        "queue_size": Config.STT_QUEUE_SIZE},
+                "llm": {"limit": Config.LLM_MAX_CONCURRENCY, "in_flight": llm_limiter.in_flight},
+                "tts": tts_gate.snapshot(),
+                "feedback": {"workers": Config.FEEDBACK_WORKERS, "queued": feedback_queue.depth()},
+            },
+            "audio_rate_per_sec": Config.AUDIO_RATE_PER_SEC,
+            **self.stats,
+        }
+
+governor = ResourceGovernor(Config.MAX_SESSIONS, Config.SESSION_WAIT_QUEUE, Config.SESSION_WAIT_TIMEOUT_S, Config.SHED_QUEUE_MS)
+tts_gate = StageGate("tts", Config.TTS_MAX_CONCURRENCY)
+
+# --- GEMINI CLIENT ---
+class LlmLimiter:
+    """Caps concurrent Gemini calls and smooths their start rate with a token bucket."""
+
+    def __init__(self, max_concurrency: int, rate_per_sec: float, burst: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate = rate_per_sec
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Rate token + concurrency slot for one call."""
+        start = time.perf_counter()
+        await self.acquire()
+        async with self.semaphore:
+            governor.record_wait("llm", time.perf_counter() - start)
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def acquire(self):
+        """Waits for a rate token (no-op when the rate is unlimited)."""
+        if self.rate <= 0: return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+llm_limiter = LlmLimiter(Config.LLM_MAX_CONCURRENCY, Config.LLM_RATE_PER_SEC, Config.LLM_BURST)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(e, genai_errors.APIError) and e.code in RETRYABLE_STATUS
+
+async def backoff(attempt: int, e: Exception):
+    delay = Config.LLM_BACKOFF_S * (2 ** attempt) * (0.5 + random.random())
+    logger.warning(f"⚠️ Gemini call failed ({e!r}), retry {attempt + 1}/{Config.LLM_MAX_RETRIES} in {delay:.1f}s")
+    await asyncio.sleep(delay)
+
+async def llm_generate(contents, config=None):
+    """Async generate_content under the global limiter, with timeout and retries."""
+    for attempt in range(Config.LLM_MAX_RETRIES + 1):
+        try:
+            async with llm_limiter.slot():
+                return await asyncio.wait_for(
+                    client.aio.models.generate_content(model=Config.MODEL_ID, contents=contents, config=config),
+                    Config.LLM_TIMEOUT_S
+                )
+        except Exception as e:
+            if attempt >= Config.LLM_MAX_RETRIES or not is_retryable(e): raise
+            await backoff(attempt, e)
+
+async def llm_stream(contents, config=None):
+    """Async generate_content_stream under the global limiter.
+
+    The timeout applies to the first chunk and to each gap between chunks. A call
+    is only retried if it failed before yielding anything.
+    """
+    for attempt in range(Config.LLM_MAX_RETRIES + 1):
+        yielded = False
+        try:
+            async with llm_limiter.slot():
+                stream = await asyncio.wait_for(
+                    client.aio.models.generate_content_stream(model=Config.MODEL_ID, contents=contents, config=config),
+                    Config.LLM_TIMEOUT_S
+                )
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), Config.LLM_TIMEOUT_S)
+                    except StopAsyncIteration:
+                        return
+                    yielded = True
+                    yield chunk
+        except Exception as e:
+            if yielded or attempt >= Config.LLM_MAX_RETRIES or not is_retryable(e): raise
+            await backoff(attempt, e)
+
+# --- PROMPT CACHE ---
+TOOL_FUNCTIONS = {f.__name__: f for f in (get_random_problem, verify_concept)}
+MAX_TOOL_ROUNDS = 3
+
+def tool_declarations() -> list:
+    return [types.Tool(function_declarations=[
+        types.FunctionDeclaration.from_callable_with_api_option(callable=f) for f in TOOL_FUNCTIONS.values()
+    ])]
+
+class GeminiCacheBackend:
+    """Gemini cached contents. Cached requests cannot carry tools, so calls are dispatched manually."""
+
+    async def create(self, system_instruction: str, ttl_s: float) -> str:
+        cache = await client.aio.caches.create(
+            model=Config.MODEL_ID,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                tools=tool_declarations(),
+                ttl=f"{int(ttl_s)}s",
+                display_name="sura-interview-prompt"
+            )
+        )
+        return cache.name
+
+    async def extend(self, name: str, ttl_s: float):
+        await client.aio.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_s)}s"))
+
+    async def delete(self, name: str):
+        await client.aio.caches.delete(name=name)
+
+    def config(self, name: str) -> "types.GenerateContentConfig":
+        return types.GenerateContentConfig(
+            cached_content=name,
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True)
+        )
+
+class MockCacheBackend:
+    """Keeps "cached" prompts locally and sends them inline, for tests without the caching API.
+
+    Requests take the same path as with Gemini caching (dynamic preamble, manual
+    tool dispatch), so only the cache storage itself is simulated.
+    """
+
+    def __init__(self):
+        self.prompts = {}
+        self.created = 0
+
+    async def create(self, system_instruction: str, ttl_s: float) -> str:
+        self.created += 1
+        name = f"cachedContents/mock-{self.created}"
+        self.prompts[name] = system_instruction
+        return name
+
+    async def extend(self, name: str, ttl_s: float):
+        if name not in self.prompts:
+            raise KeyError(name)
+
+    async def delete(self, name: str):
+        self.prompts.pop(name, None)
+
+    def config(self, name: str) -> "types.GenerateContentConfig":
+        return types.GenerateContentConfig(
+            system_instruction=self.prompts[name],
+            tools=tool_declarations(),
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True)
+        )
+
+class PromptCache:
+    """Cache names for static system prompts, keyed by (role, resume digest).
+
+    Entries are extended shortly before their TTL runs out. Prompts below the
+    API's minimum size, and failed creations, are remembered as uncacheable for
+    one TTL so they are not retried every turn.
+    """
+
+    def __init__(self, backend, ttl_s: float, refresh_s: float, min_tokens: int):
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.refresh_s = refresh_s
+        self.min_tokens = min_tokens
+        self.entries = {}  # key -> (name or None, expires)
+        self.locks = defaultdict(asyncio.Lock)
+        self.stats = {"hits": 0, "created": 0, "extended": 0, "uncacheable": 0, "errors": 0}
+
+    def _fresh(self, key):
+        entry = self.entries.get(key)
+        if entry and entry[1] - time.time() > self.refresh_s:
+            return entry
+        return None
+
+    async def get(self, key, system_instruction: str):
+        """Cache name for system_instruction, or None to send it inline."""
+        if entry := self._fresh(key):
+            self.stats["hits" if entry[0] else "uncacheable"] += 1
+            return entry[0]
+        async with self.locks[key]:
+            if entry := self._fresh(key):
+                return entry[0]
+            self._prune(key)
+            old = self.entries.get(key)
+            expires = time.time() + self.ttl_s
+            if old and old[0]:
+                try:
+                    await self.backend.extend(old[0], self.ttl_s)
+                    self.entries[key] = (old[0], expires)
+                    self.stats["extended"] += 1
+                    return old[0]
+                except Exception as e:
+                    logger.warning(f"Prompt cache extend failed, recreating: {e}")
+            name = None
+            if estimate_tokens(system_instruction) >= self.min_tokens:
+                try:
+                    name = await self.backend.create(system_instruction, self.ttl_s)
+                    self.stats["created"] += 1
+                    logger.info(f"🗄️ Cached prompt for {key[0]} ({estimate_tokens(system_instruction)} tokens)")
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.warning(f"Prompt cache create failed, sending inline: {e}")
+            self.stats["hits" if name else "uncacheable"] += 1
+            self.entries[key] = (name, expires)
+            return name
+
+    def _prune(self, keep):
+        now = time.time()
+        for key in [k for k, (_, expires) in self.entries.items() if expires <= now and k != keep]:
+            del self.entries[key]
+            self.locks.pop(key, None)
+
+    async def close(self):
+        """Deletes live caches so they stop accruing storage before their TTL."""
+        for name, expires in list(self.entries.values()):
+            if name and expires > time.time():
+                try:
+                    await self.backend.delete(name)
+                except Exception as e:
+                    logger.warning(f"Prompt cache delete failed: {e}")
+        self.entries.clear()
+
+def make_prompt_cache():
+    backends = {"gemini": GeminiCacheBackend, "mock": MockCacheBackend}
+    if Config.PROMPT_CACHE not in backends:
+        return None
+    return PromptCache(backends[Config.PROMPT_CACHE](), Config.PROMPT_CACHE_TTL_S,
+                       Config.PROMPT_CACHE_REFRESH_S, Config.PROMPT_CACHE_MIN_TOKENS)
+
+prompt_cache = make_prompt_cache()
+
+@lru_cache(maxsize=64)
+def build_static_prompt(role: str, resume: str) -> str:
+    """Role prompt + full resume: the per-session prefix that is worth caching."""
+    system_prompt = INTERVIEW_PROMPTS.get(role, INTERVIEW_PROMPTS["general"])
+    if resume:
+        system_prompt += f"\n\nCANDIDATE RESUME:\n{resume}\n\nAsk specific questions about their resume."
+    return system_prompt
+
+async def chat_config(role: str, resume: str, coding_completed: bool, query: str):
+    """Returns (config, preamble contents) for a chat turn.
+
+    With a cached prompt only the dynamic state travels in the preamble; otherwise
+    the role prompt and the resume sections relevant to query go inline.
+    """
+    if prompt_cache is not None:
+        key = (role, hashlib.sha256(resume.encode()).hexdigest() if resume else "")
+        name = await prompt_cache.get(key, build_static_prompt(role, resume))
+        if name:
+            note = f"[SYSTEM: Coding completed: {coding_completed}]"
+            return prompt_cache.backend.config(name), [{"role": "user", "parts": [{"text": note}]}]
+    resume_block = resume_context(resume, query)
+    config = types.GenerateContentConfig(
+        tools=[get_random_problem, verify_concept],
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=False),
+        system_instruction=build_system_prompt(role, resume_block, coding_completed)
+    )
+    return config, []
+
+def manual_tools(config) -> bool:
+    afc = config.automatic_function_calling if config else None
+    return bool(afc and afc.disable and (config.cached_content or config.tools))
+
+async def run_tool_calls(calls) -> "types.Content":
+    parts = []
+    for call in calls:
+        fn = TOOL_FUNCTIONS.get(call.name)
+        try:
+            if fn is None:
+                raise ValueError(f"Unknown tool {call.name}")
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(**(call.args or {}))
+            else:
+                result = await asyncio.to_thread(fn, **(call.args or {}))
+            response = {"result": result}
+        except Exception as e:
+            response = {"error": str(e)}
+        logger.info(f"🔧 Tool call: {call.name}")
+        parts.append(types.Part.from_function_response(name=call.name, response=response))
+    return types.Content(role="user", parts=parts)
+
+async def chat_generate(contents: list, config):
+    """llm_generate, dispatching tool calls itself when the config has no AFC."""
+    contents = list(contents)
+    for _ in range(MAX_TOOL_ROUNDS):
+        with stage("llm"):
+            resp = await llm_generate(contents, config)
+        if not manual_tools(config) or not resp.function_calls:
+            return resp
+        contents.append(resp.candidates[0].content)
+        contents.append(await run_tool_calls(resp.function_calls))
+    return resp
+
+async def chat_stream(contents: list, config):
+    """llm_stream, dispatching tool calls itself when the config has no AFC."""
+    contents = list(contents)
+    for _ in range(MAX_TOOL_ROUNDS):
+        calls = []
+        async for chunk in llm_stream(contents, config):
+            if manual_tools(config) and chunk.function_calls:
+                calls += chunk.function_calls
+            yield chunk
+        if not calls:
+            return
+        contents.append(types.Content(role="model", parts=[types.Part(function_call=c) for c in calls]))
+        contents.append(await run_tool_calls(calls))
+
+# --- CONVERSATION HISTORY ---
+SUMMARY_PROMPT = """You maintain running notes on a job interview. Update the notes with the new transcript excerpt.
+Keep every fact useful for the rest of the interview and for final feedback: topics covered, questions asked,
+the candidate's answers and their quality, coding results. Write at most {words} words of plain text.
+
+Current notes:
+{summary}
+
+New excerpt:
+{excerpt}"""
+
+class PromptStats:
+    """Prompt size per turn, to check HISTORY_TOKEN_BUDGET against real interviews."""
+
+    def __init__(self):
+        self.turns = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.last_tokens = 0
+        self.summaries = 0
+
+    def record(self, tokens: int):
+        self.turns += 1
+        self.total_tokens += tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        self.last_tokens = tokens
+
+    def snapshot(self) -> dict:
+        return {
+            "turns": self.turns,
+            "avg_tokens": self.total_tokens / self.turns if self.turns else 0.0,
+            "max_tokens": self.max_tokens,
+            "last_tokens": self.last_tokens,
+            "summaries": self.summaries,
+            "token_budget": Config.HISTORY_TOKEN_BUDGET,
+        }
+
+prompt_stats = PromptStats()
+
+class HistoryManager:
+    """Conversation history with a bounded prompt view.
+
+    Every turn is kept in `turns` for the transcript. The prompt gets a rolling
+    summary of older turns plus the newest ones verbatim, trimmed to token_budget.
+    Once more than keep_turns turns are unsummarized, the overflow is folded
+    into the summary by a background Gemini call.
+    """
+
+    def __init__(self, keep_turns: int, token_budget: int, summary_tokens: int):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.turns = []
+        self.summary = ""
+        self.summarized = 0  # turns[:summarized] are covered by the summary
+        self.summary_task = None
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, content: dict):
+        self.turns.append(content)
+        if content["role"] == "model":
+            self.compact()
+
+    def to_dict(self) -> dict:
+        return {"turns": self.turns, "summary": self.summary, "summarized": self.summarized}
+
+    def load(self, data: dict):
+        self.turns = list(data["turns"])
+        self.summary = data["summary"]
+        self.summarized = data["summarized"]
+
+    def snapshot(self) -> "HistoryManager":
+        """Copy of the transcript and summary, safe to read while the interview goes on."""
+        copy = HistoryManager(self.keep_turns, self.token_budget, self.summary_tokens)
+        copy.turns = list(self.turns)
+        copy.summary = self.summary
+        copy.summarized = self.summarized
+        return copy
+
+    def last_text(self, role: str) -> str:
+        for content in reversed(self.turns):
+            if content["role"] == role:
+                return content["parts"][0]["text"]
+        return ""
+
+    @staticmethod
+    def transcript(turns: list) -> str:
+        return "\n".join(
+            f"{'Interviewer' if c['role'] == 'model' else 'Candidate'}: {c['parts'][0]['text']}" for c in turns
+        )
+
+    def _fit(self, budget: int) -> list:
+        """Newest unsummarized turns that fit in budget (always at least the last one)."""
+        kept, used = [], 0
+        for content in reversed(self.turns[self.summarized:]):
+            cost = estimate_tokens(content["parts"][0]["text"])
+            if kept and used + cost > budget:
+                break
+            kept.append(content)
+            used += cost
+        kept.reverse()
+        return kept
+
+    def contents(self) -> list:
+        """Gemini contents for the next call, recorded in prompt_stats."""
+        contents = []
+        budget = self.token_budget
+        if self.summary:
+            note = f"[SYSTEM: Summary of the interview so far: {self.summary}]"
+            contents.append({"role": "user", "parts": [{"text": note}]})
+            budget -= estimate_tokens(note)
+        recent = self._fit(budget)
+        contents += recent
+        tokens = sum(estimate_tokens(c["parts"][0]["text"]) for c in contents)
+        prompt_stats.record(tokens)
+        logger.info(f"📏 Prompt history: ~{tokens} tokens ({len(recent)}/{len(self.turns)} turns verbatim)")
+        return contents
+
+    def feedback_transcript(self, budget: int) -> str:
+        """Summary plus as many recent turns as fit in budget, for the feedback prompt."""
+        parts = [f"Summary of earlier turns: {self.summary}"] if self.summary else []
+        parts.append(self.transcript(self._fit(budget - estimate_tokens(self.summary))))
+        return "\n\n".join(parts)
+
+    def compact(self):
+        if len(self.turns) - self.summarized <= self.keep_turns:
+            return
+        if self.summary_task is None or self.summary_task.done():
+            self.summary_task = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        end = len(self.turns) - self.keep_turns
+        excerpt = self.transcript(self.turns[self.summarized:end])
+        words = self.summary_tokens * 3 // 4
+        try:
+            resp = await llm_generate(SUMMARY_PROMPT.format(words=words, summary=self.summary or "(none)", excerpt=excerpt))
+            summary = (resp.text or "").strip()
+            if not summary:
+                raise ValueError("empty summary")
+        except Exception as e:
+            logger.warning(f"History summary failed, keeping an extract: {e}")
+            summary = f"{self.summary}\n{excerpt}".strip()[-self.summary_tokens * 4:]
+        self.summary = summary[:self.summary_tokens * 4]
+        self.summarized = end
+        prompt_stats.summaries += 1
+
+def new_history() -> HistoryManager:
+    return HistoryManager(Config.HISTORY_KEEP_TURNS, Config.HISTORY_TOKEN_BUDGET, Config.HISTORY_SUMMARY_TOKENS)
+
+# --- SESSION STATE ---
+class SessionState:
+    """Everything a /ws connection needs to carry on an interview, serializable so any worker can resume it."""
+
+    def __init__(self, role: str = "general", id: str = None):
+        self.id = id or uuid.uuid4().hex
+        self.role = role
+        self.history = new_history()
+        self.coding_phase = False
+        self.coding_completed = False
+        self.turn_seq = 0
+        self.resume_text = ""
+        self.feedback_key = self.id  # Dedupes feedback requests
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "role": self.role,
+            "history": self.history.to_dict(),
+            "coding_phase": self.coding_phase,
+            "coding_completed": self.coding_completed,
+            "turn_seq": self.turn_seq,
+            "resume_text": self.resume_text,
+            "feedback_key": self.feedback_key,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionState":
+        state = cls(data["role"], data["id"])
+        state.history.load(data["history"])
+        state.coding_phase = data["coding_phase"]
+        state.coding_completed = data["coding_completed"]
+        state.turn_seq = data["turn_seq"]
+        state.resume_text = data["resume_text"]
+        state.feedback_key = data["feedback_key"]
+        return state
+
+class MemorySessionStore:
+    """Per-process LRU of serialized sessions; a reconnect must land on the same worker."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # id -> (expires, json)
+
+    async def get(self, session_id: str):
+        entry = self.entries.get(session_id)
+        if entry is None or entry[0] < time.time():
+            return None
+        return json.loads(entry[1])
+
+    async def put(self, session_id: str, state: dict):
+        self.entries[session_id] = (time.time() + self.ttl, json.dumps(state))
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, session_id: str):
+        self.entries.pop(session_id, None)
+
+    async def close(self):
+        pass
+
+class SqliteSessionStore:
+    """Sessions in a SQLite file shared by all workers on a host."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS session_state (id TEXT PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS session_state_expires ON session_state (expires)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _get(self, session_id: str):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT state FROM session_state WHERE id = ? AND expires >= ?",
+                             (session_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, session_id: str, state: str):
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO session_state VALUES (?, ?, ?)", (session_id, state, now + self.ttl))
+            db.execute("DELETE FROM session_state WHERE expires < ?", (now,))
+
+    def _delete(self, session_id: str):
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM session_state WHERE id = ?", (session_id,))
+
+    async def get(self, session_id: str):
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def put(self, session_id: str, state: dict):
+        await asyncio.to_thread(self._put, session_id, json.dumps(state))
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete, session_id)
+
+    async def close(self):
+        pass
+
+class RedisSessionStore:
+    """Sessions in Redis (or anything speaking its protocol: Valkey, KeyDB, Dragonfly), shared by all hosts."""
+
+    def __init__(self, url: str, ttl: float):
+        self.redis = RespClient(url)
+        self.ttl = ttl
+
+    async def close(self):
+        await self.redis.close()
+
+    async def get(self, session_id: str):
+        data = await self.redis.command("GET", f"sura:session:{session_id}")
+        return json.loads(data) if data else None
+
+    async def put(self, session_id: str, state: dict):
+        await self.redis.command("SET", f"sura:session:{session_id}", json.dumps(state), "EX", int(self.ttl))
+
+    async def delete(self, session_id: str):
+        await self.redis.command("DEL", f"sura:session:{session_id}")
+
+def make_session_store():
+    if Config.SESSION_STORE == "sqlite":
+        return SqliteSessionStore(Config.SESSION_STORE_PATH, Config.SESSION_TTL_S)
+    if Config.SESSION_STORE == "redis":
+        return RedisSessionStore(Config.SESSION_REDIS_URL, Config.SESSION_TTL_S)
+    return MemorySessionStore(Config.SESSION_CACHE_SIZE, Config.SESSION_TTL_S)
+
+session_store = make_session_store()
+session_stats = {"saved": 0, "resumed": 0, "expired": 0, "errors": 0}
+
+async def load_session(session_id: str):
+    """The stored SessionState for session_id, or None if unknown, expired or unreadable."""
+    try:
+        data = await session_store.get(session_id) if session_id else None
+    except Exception as e:
+        logger.error(f"Session load failed: {e}")
+        session_stats["errors"] += 1
+        return None
+    if data is None:
+        session_stats["expired"] += 1
+        return None
+    session_stats["resumed"] += 1
+    return SessionState.from_dict(data)
+
+async def save_session(state: SessionState):
+    try:
+        await session_store.put(state.id, state.to_dict())
+        session_stats["saved"] += 1
+    except Exception as e:
+        logger.error(f"Session save failed: {e}")
+        session_stats["errors"] += 1
+
+# --- FEEDBACK GENERATION ---
+class FeedbackStore:
+    """Feedback reports with their transcript in a SQLite file (WAL, shared by all workers on a host)."""
+
+    COLUMNS = "id, created, role, session, overall_score"
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_report ("
+                "id TEXT PRIMARY KEY, created REAL NOT NULL, role TEXT NOT NULL, session TEXT, "
+                "overall_score REAL, feedback TEXT NOT NULL, transcript TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS feedback_report_created ON feedback_report (created, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS feedback_report_role ON feedback_report (role, created)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _insert(self, row: tuple):
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT INTO feedback_report VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def _select(self, sql: str, args: tuple) -> list:
+        with closing(self._connect()) as db:
+            return [dict(r) for r in db.execute(sql, args).fetchall()]
+
+    async def save(self, feedback: dict, turns: list, role: str, session: str = None) -> str:
+        report_id = uuid.uuid4().hex
+        score = feedback.get("overall_score")
+        row = (
+            report_id, time.time(), role, session,
+            score if isinstance(score, (int, float)) else None,
+            json.dumps(feedback), json.dumps(turns)
+        )
+        await asyncio.to_thread(self._insert, row)
+        return report_id
+
+    async def get(self, report_id: str):
+        rows = await asyncio.to_thread(
+            self._select, f"SELECT {self.COLUMNS}, feedback, transcript FROM feedback_report WHERE id = ?", (report_id,)
+        )
+        if not rows:
+            return None
+        report = rows[0]
+        report["feedback"] = json.loads(report["feedback"])
+        report["transcript"] = json.loads(report["transcript"])
+        return report
+
+    async def list(self, limit: int, before: float = None, role: str = None) -> list:
+        """Report summaries, newest first; pass the last row's `created` as `before` for the next page."""
+        where, args = [], []
+        if before is not None:
+            where.append("created < ?")
+            args.append(before)
+        if role:
+            where.append("role = ?")
+            args.append(role)
+        sql = f"SELECT {self.COLUMNS} FROM feedback_report"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC, id DESC LIMIT ?"
+        return await asyncio.to_thread(self._select, sql, (*args, limit))
+
+feedback_store = FeedbackStore(Config.FEEDBACK_DB_PATH)
+
+async def generate_feedback(history: HistoryManager, role: str, session: str = None) -> dict:
+    """Generate interview feedback based on conversation history and role."""
+    try:
+        # Create a prompt for feedback generation
+        feedback_prompt = f"""Analyze this {role.replace('_', ' ')} interview and provide detailed, comprehensive feedback.
+
+Interview Transcript:
+{history.feedback_transcript(Config.FEEDBACK_TOKEN_BUDGET)}
+
+Provide feedback in the following JSON format:
+{{
+    "overall_score": <1-10>,
+    "communication": {{"score": <1-10>, "feedback": "..."}},
+    "technical_knowledge": {{"score": <1-10>, "feedback": "..."}},
+    "problem_solving": {{"score": <1-10>, "feedback": "..."}},
+    "strengths": ["strength1", "strength2", "strength3"],
+    "improvements": ["area1", "area2", "area3"],
+    "summary": "Overall assessment..."
+}}
+
+Be specific, constructive, and actionable. Provide detailed feedback."""
+
+        resp = await llm_generate(feedback_prompt)
+        
+        # Parse JSON from response
+        feedback_text = resp.text
+        # Extract JSON from response
+        json_match = re.search(r'\{.*\}', feedback_text, re.DOTALL)
+        if json_match:
+            feedback_data = json.loads(json_match.group())
+        else:
+            feedback_data = {
+                "overall_score": 7,
+                "communication": {"score": 7, "feedback": "Good communication throughout"},
+                "technical_knowledge": {"score": 7, "feedback": "Demonstrated knowledge"},
+                "problem_solving": {"score": 7, "feedback": "Approached problems logically"},
+                "strengths": ["Clear communication", "Good attitude"],
+                "improvements": ["More specific examples", "Deeper technical details"],
+                "summary": "Overall solid performance in the interview."
+            }
         
-        logger.info(f"📄 Feedback saved to: {filename}")
-        feedback_data['filename'] = filename  # Add filename to response
+        report_id = await feedback_store.save(feedback_data, history.turns, role, session)
+        logger.info(f"📄 Feedback saved as report {report_id}")
+        feedback_data['report_id'] = report_id  # See GET /api/feedback/{report_id}
         return feedback_data
         
     except Exception as e:
         logger.error(f"Feedback generation error: {e}")
         return {"error": "Could not generate feedback"}
 
+class FeedbackQueue:
+    """Runs feedback generation on a few background workers.
+
+    One job per session at a time: requests while a job is pending join it, and a
+    finished result is reused until the interview has new turns. Results are
+    pushed to the job's notify callbacks and kept for GET /api/feedback/jobs/{id}.
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_jobs: int = 1000):
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()  # job id -> job dict
+        self.by_session = {}  # session -> latest job id
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def submit(self, session: str, history: HistoryManager, role: str, notify) -> str:
+        """Queues feedback for session (or joins its current job) and returns the job id.
+
+        notify(message) receives the {"type": "feedback"} message when the job ends.
+        """
+        job = self.jobs.get(self.by_session.get(session))
+        if job and job["status"] == "pending":
+            job["listeners"].append(notify)
+            return job["id"]
+        if job and job["status"] == "done" and job["turns"] == len(history):
+            await notify(self.message(job))
+            return job["id"]
+
+        job = {
+            "id": uuid.uuid4().hex, "session": session, "role": role, "status": "pending",
+            "turns": len(history), "result": None, "created": time.time(), "listeners": [notify],
+        }
+        try:
+            self.queue.put_nowait((job, history.snapshot()))
+        except asyncio.QueueFull:
+            job.update(status="error", result={"error": "Feedback is busy, please try again shortly"})
+            await notify(self.message(job))
+            return job["id"]
+        self.jobs[job["id"]] = job
+        self.by_session[session] = job["id"]
+        while len(self.jobs) > self.max_jobs:
+            old = self.jobs.popitem(last=False)[1]
+            if self.by_session.get(old["session"]) == old["id"]:
+                del self.by_session[old["session"]]
+        return job["id"]
+
+    @staticmethod
+    def message(job: dict) -> dict:
+        return {"type": "feedback", "job_id": job["id"], "data": job["result"]}
+
+    def get(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: job[k] for k in ("id", "status", "role", "created", "result")}
+
+    async def _worker(self):
+        while True:
+            job, history = await self.queue.get()
+            try:
+                with stage("feedback", role=job["role"]):
+                    job["result"] = await generate_feedback(history, job["role"], job["session"])
+                job["status"] = "error" if "error" in job["result"] else "done"
+            except Exception as e:
+                logger.error(f"Feedback job failed: {e}")
+                job.update(status="error", result={"error": "Could not generate feedback"})
+            listeners, job["listeners"] = job["listeners"], []
+            for notify in listeners:
+                await notify(self.message(job))
+
+feedback_queue = FeedbackQueue(Config.FEEDBACK_WORKERS, Config.FEEDBACK_QUEUE_SIZE)
+
 # --- STARTUP ---
+def create_gemini_client():
+    """Imports the genai SDK and builds the client; runs off the event loop."""
+    global client
+    start = time.perf_counter()
+    try:
+        client = genai.Client(api_key=Config.GEMINI_API_KEY)
+    except Exception as e:
+        logger.error(f"Gemini client failed: {e}")
+        startup_errors["gemini"] = str(e)
+        return
+    logger.info(f"✅ Gemini client ready in {time.perf_counter() - start:.1f}s")
+    # Not needed for readiness; imported now so its first use does not pay for it
+    try:
+        edge_tts._load()
+    except Exception as e:
+        logger.warning(f"Preloading edge_tts failed: {e}")
+
+async def wait_ready(gemini_task):
+    await gemini_task
+    await asyncio.to_thread(stt_scheduler.wait_loaded)
+    logger.info(f"✅ Ready {time.monotonic() - STARTED_AT:.1f}s after start")
+
 @app.on_event("startup")
-def startup():
-    global whisper_model, client
+async def startup():
+    """Starts Whisper and Gemini loading in the background (STARTUP_MODE=background,
+    readiness via /readyz) or waits for both before serving (blocking)."""
+    global stt_scheduler
     load_questions()
-    logger.info(f"🚀 Loading Whisper ({Config.WHISPER_MODEL_SIZE})...")
-    whisper_model = WhisperModel(Config.WHISPER_MODEL_SIZE, device="cpu", compute_type=Config.WHISPER_COMPUTE)
-    client = genai.Client(api_key=Config.GEMINI_API_KEY)
-    logger.info("✅ Ready")
+    stt_scheduler = SttScheduler()
+    stt_scheduler.start()
+    gemini_task = asyncio.create_task(asyncio.to_thread(create_gemini_client))
+    if Config.STARTUP_MODE == "blocking":
+        await wait_ready(gemini_task)
+    else:
+        startup_tasks.add(asyncio.create_task(wait_ready(gemini_task)))
+        logger.info(f"✅ Serving {time.monotonic() - STARTED_AT:.1f}s after start; models loading in the background")
+
+startup_tasks = set()  # Keeps background startup tasks referenced
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    if piston_http is not None:
+        await piston_http.aclose()
+    if wiki_http is not None:
+        await wiki_http.aclose()
+    await local_executor.close()
+    if prompt_cache is not None:
+        await prompt_cache.close()
+    await feedback_queue.close()
+    await session_store.close()
+    await resume_store.close()
+
+@app.on_event("shutdown")
+def close_pdf_pool():
+    if pdf_pool is not None:
+        pdf_pool.shutdown(cancel_futures=True)
+
+@app.on_event("startup")
+async def start_feedback_workers():
+    feedback_queue.start()
+
+@app.on_event("startup")
+async def subscribe_resume_events():
+    await resume_store.subscribe(dispatch_resume_event)
+
+@app.on_event("startup")
+async def start_code_executor():
+    if Config.CODE_EXECUTOR == "local":
+        await local_executor.start()
+
+@app.on_event("startup")
+async def prewarm_tts():
+    # Fixed phrases every session hears; synthesized in the background
+    phrases = [FALLBACK_REPLY, ERROR_REPLY]
+    for role in INTERVIEW_PROMPTS:
+        phrases += [build_greeting(role, True), build_greeting(role, False)]
+    run_in_background(tts_cache.prewarm(phrases))
 
 # --- HELPERS ---
-async def generate_tts(text: str):
+class TtsCache:
+    """Synthesized audio keyed by (voice, normalized text).
+
+    A byte-bounded in-memory LRU sits in front of an optional content-addressed
+    directory of MP3 files that survives restarts and is shared by workers. The
+    directory has its own byte budget; files read least recently (by mtime, which
+    a disk hit refreshes) are deleted when it is exceeded.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str = "", disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_size = 0
+        self.disk_lock = threading.Lock()  # Disk writes run in worker threads
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0, "evictions": 0, "disk_evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.disk_size = sum(size for _, size, _ in self._disk_files())
+
+    @staticmethod
+    def key(text: str, voice: str = None) -> str:
+        normalized = " ".join(text.replace("*", "").split())
+        return hashlib.sha256(f"{voice or Config.VOICE_NAME}\n{normalized}".encode()).hexdigest()
+
+    def _remember(self, key: str, audio: bytes):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        if len(audio) > self.max_bytes:
+            return
+        self.entries[key] = audio
+        self.size += len(audio)
+        while self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= len(old)
+            self.stats["evictions"] += 1
+
+    async def get(self, text: str):
+        key = self.key(text)
+        audio = self.entries.get(key)
+        if audio is not None:
+            self.entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+        elif self.disk_dir:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio is not None:
+                self._remember(key, audio)
+                self.stats["disk_hits"] += 1
+        if audio is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["bytes_saved"] += len(audio)
+        return audio
+
+    async def put(self, text: str, audio: bytes):
+        key = self.key(text)
+        self._remember(key, audio)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, audio)
+
+    def _read_disk(self, key: str):
+        path = os.path.join(self.disk_dir, f"{key}.mp3")
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # Recently used: evicted last
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = os.path.join(self.disk_dir, f"{key}.mp3")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, path)
+        with self.disk_lock:
+            self.disk_size += len(audio)
+            if self.disk_max_bytes and self.disk_size > self.disk_max_bytes:
+                self._prune_disk()
+
+    def _disk_files(self) -> list:
+        """(mtime, size, path) of every cached file."""
+        files = []
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".mp3"): continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # Pruned by another worker
+                files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _prune_disk(self):
+        """Deletes the oldest files until the directory is under 90% of its budget.
+
+        Rescans rather than trusting disk_size, since other workers share the directory.
+        """
+        files = sorted(self._disk_files())
+        self.disk_size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.disk_size <= self.disk_max_bytes * 0.9: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.disk_size -= size
+            self.stats["disk_evictions"] += 1
+
+    async def prewarm(self, phrases: list):
+        warmed = 0
+        for phrase in phrases:
+            if self.key(phrase) in self.entries: continue
+            if await generate_tts(phrase): warmed += 1
+        logger.info(f"🔥 TTS cache pre-warmed with {warmed} phrases")
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "memory_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "disk_tier": bool(self.disk_dir),
+            "disk_bytes": self.disk_size,
+            "disk_max_bytes": self.disk_max_bytes,
+        }
+
+tts_cache = TtsCache(Config.TTS_CACHE_MAX_BYTES, Config.TTS_CACHE_DIR, Config.TTS_CACHE_DISK_MAX_BYTES)
+
+async def stream_tts(text: str):
+    """Yields MP3 chunks as edge_tts produces them, or the cached audio on a hit."""
     clean = text.replace("*", "").strip()
-    if not clean: return None
-    try:
-        logger.info(f"🔊 Generating TTS for: {clean[:50]}...")
+    if not clean: return
+    cached = await tts_cache.get(clean)
+    if cached is not None:
+        yield cached
+        return
+    logger.info(f"🔊 Generating TTS for: {clean[:50]}...")
+    chunks = []
+    async with tts_gate.slot():
+        span = start_span("tts", chars=len(clean))
         comm = edge_tts.Communicate(clean, Config.VOICE_NAME)
-        out = b""
-        async for chunk in comm.stream():
-            if chunk["type"] == "audio": out += chunk["data"]
+        try:
+            async for chunk in comm.stream():
+                if chunk["type"] == "audio":
+                    if not chunks:
+                        STAGE_SECONDS.observe("tts_first_chunk", time.perf_counter() - span.start)
+                    chunks.append(chunk["data"])
+                    yield chunk["data"]
+        finally:
+            span.end()
+    if chunks:
+        await tts_cache.put(clean, b"".join(chunks))
+
+async def generate_tts(text: str):
+    try:
+        chunks = [data async for data in stream_tts(text)]
+        if not chunks: return None
+        out = b"".join(chunks)
         logger.info(f"✅ TTS Generated: {len(out)} bytes")
         return out
     except Exception as e:
         logger.error(f"TTS Error: {e}")
         return None
 
-def transcribe(data: bytes):
-    try:
-        audio = AudioSegment.from_file(io.BytesIO(data)).set_frame_rate(16000).set_channels(1)
-        wav_io = io.BytesIO()
-        audio.export(wav_io, format="wav")
-        wav_io.seek(0)
-        
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            tmp.write(wav_io.read())
-            tpath = tmp.name
-        
-        # Enhanced transcription settings to reduce hallucinations
-        segs, info = whisper_model.transcribe(
-            tpath, 
-            beam_size=1,
-            temperature=0.0,
-            vad_filter=True,  # Voice Activity Detection to filter silence
-            condition_on_previous_text=False,  # Prevent repetitive hallucinations
-            log_prob_threshold=-1.0,  # Filter low-confidence segments
-            no_speech_threshold=0.6,  # Higher threshold for detecting silence
-            compression_ratio_threshold=2.4  # Detect repetitive text
-        )
-        
-        # Filter segments by log probability and no_speech_prob
-        filtered_segments = []
-        for seg in segs:
-            # Skip segments with low confidence or high no_speech probability
-            if hasattr(seg, 'avg_logprob') and seg.avg_logprob < -1.0:
-                logger.info(f"🔇 Skipped low-confidence segment: {seg.text}")
-                continue
-            if hasattr(seg, 'no_speech_prob') and seg.no_speech_prob > 0.6:
-                logger.info(f"🔇 Skipped likely silence: {seg.text}")
-                continue
-            filtered_segments.append(seg.text)
-        
-        text = " ".join(filtered_segments).strip()
-        os.remove(tpath)
-        
-        cleaned = text.lower().translate(str.maketrans('', '', string.punctuation)).strip()
-        
-        # Advanced hallucination detection
-        
-        # 1. Check for repetitive patterns (e.g., "a little bit of" repeated)
+def prefetch_tts(text: str):
+    """Starts synthesizing text now and returns an async iterator over its chunks."""
+    chunks = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for data in stream_tts(text):
+                await chunks.put(data)
+        except Exception as e:
+            logger.error(f"TTS Error: {e}")
+        finally:
+            await chunks.put(None)
+
+    task = asyncio.create_task(produce())
+
+    async def consume():
+        try:
+            while (data := await chunks.get()) is not None:
+                yield data
+        finally:
+            task.cancel()
+
+    return consume()
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def split_sentences(text: str):
+    """Splits streamed text into (complete sentences, unfinished remainder)."""
+    if text.count("{") > text.count("}"):
+        return [], text  # Inside a JSON blob, wait for it to close
+    pieces = SENTENCE_BREAK.split(text)
+    return [p for p in pieces[:-1] if p.strip()], pieces[-1]
+
+def speakable(sentence: str) -> str:
+    """Strips control markers; returns "" for fragments that should not be spoken."""
+    clean = sentence.replace("[[END_INTERVIEW]]", "").strip()
+    if "{" in clean or "}" in clean:
+        return ""
+    return clean
+
+# Shared decoding options, tuned to reduce hallucinations
+WHISPER_OPTIONS = dict(
+    beam_size=1,
+    temperature=0.0,
+    vad_filter=True,  # Voice Activity Detection to filter silence
+    condition_on_previous_text=False,  # Prevent repetitive hallucinations
+    log_prob_threshold=-1.0,  # Filter low-confidence segments
+    no_speech_threshold=0.6,  # Higher threshold for detecting silence
+    compression_ratio_threshold=2.4  # Detect repetitive text
+)
+
+def decode_pcm(data: bytes) -> np.ndarray:
+    """Decodes an encoded audio blob to 16 kHz mono float32 samples in memory.
+
+    PyAV reads straight from the received bytes and resamples in one pass, so
+    there is no WAV re-export and no temp file on disk.
+    """
+    return faster_whisper.decode_audio(io.BytesIO(data), sampling_rate=16000)
+
+class SpeechGate:
+    """Energy VAD run before Whisper: rejects clips without speech and trims silence.
+
+    Frames are 30 ms. A frame is speech when its level is above both an absolute
+    floor and the clip's own noise floor (10th percentile) plus a margin, so
+    steady background noise does not count. Costs well under a millisecond per
+    second of audio, against hundreds of milliseconds for Whisper.
+    """
+
+    FRAME = 480  # 30 ms at 16 kHz
+
+    def __init__(self, threshold_db: float, margin_db: float, min_speech_ms: int, pad_ms: int):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.min_speech_frames = max(1, min_speech_ms * 16 // self.FRAME)
+        self.pad = pad_ms * 16
+        self.lock = threading.Lock()
+        self.stats = {"clips": 0, "rejected": 0, "audio_s": 0.0, "skipped_s": 0.0, "gate_ms": 0.0,
+                      "whisper_s": 0.0, "whisper_audio_s": 0.0}
+
+    def __call__(self, audio: np.ndarray):
+        """Returns the trimmed clip, or None when it holds no speech."""
+        start = time.perf_counter()
+        n = len(audio) // self.FRAME
+        kept = None
+        if n >= self.min_speech_frames:
+            frames = audio[:n * self.FRAME].reshape(n, self.FRAME)
+            db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+            threshold = max(self.threshold_db, np.percentile(db, 10) + self.margin_db)
+            speech = np.flatnonzero(db > threshold)
+            if len(speech) >= self.min_speech_frames:
+                lo = max(0, speech[0] * self.FRAME - self.pad)
+                hi = min(len(audio), (speech[-1] + 1) * self.FRAME + self.pad)
+                kept = audio[lo:hi]
+        with self.lock:
+            self.stats["clips"] += 1
+            self.stats["rejected"] += kept is None
+            self.stats["audio_s"] += len(audio) / 16000
+            self.stats["skipped_s"] += (len(audio) - (0 if kept is None else len(kept))) / 16000
+            self.stats["gate_ms"] += (time.perf_counter() - start) * 1000
+        return kept
+
+    def record_whisper(self, seconds: float, samples: int):
+        """Whisper time per audio second, used to estimate the CPU the gate saved."""
+        with self.lock:
+            self.stats["whisper_s"] += seconds
+            self.stats["whisper_audio_s"] += samples / 16000
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        rate = stats["whisper_s"] / stats["whisper_audio_s"] if stats["whisper_audio_s"] else 0.0
+        return {
+            **stats,
+            "rejected_ratio": stats["rejected"] / stats["clips"] if stats["clips"] else 0.0,
+            "whisper_s_per_audio_s": rate,
+            "cpu_saved_s": stats["skipped_s"] * rate - stats["gate_ms"] / 1000,
+        }
+
+speech_gate = SpeechGate(Config.STT_VAD_THRESHOLD_DB, Config.STT_VAD_MARGIN_DB,
+                         Config.STT_VAD_MIN_SPEECH_MS, Config.STT_VAD_PAD_MS)
+
+def keep_segment(seg) -> bool:
+    """Filters segments by log probability and no_speech_prob."""
+    # Skip segments with low confidence or high no_speech probability
+    if hasattr(seg, 'avg_logprob') and seg.avg_logprob < -1.0:
+        logger.info(f"🔇 Skipped low-confidence segment: {seg.text}")
+        return False
+    if hasattr(seg, 'no_speech_prob') and seg.no_speech_prob > 0.6:
+        logger.info(f"🔇 Skipped likely silence: {seg.text}")
+        return False
+    return True
+
+def run_whisper(model: "WhisperModel", audio: np.ndarray) -> str:
+    """Runs Whisper on a 16 kHz sample array and joins the confident segments."""
+    with stage("whisper") as span:
+        segs, info = model.transcribe(audio, **WHISPER_OPTIONS)
+        text = " ".join(seg.text for seg in segs if keep_segment(seg)).strip()  # Segments decode lazily
+    speech_gate.record_whisper(time.perf_counter() - span.start, len(audio))
+    return text
+
+WARMUP_CLIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warmup.wav")
+
+def warm_up(model: "WhisperModel"):
+    """Runs the bundled silent clip through decode, Silero VAD and Whisper once.
+
+    The first call of each pays one-off costs (codec setup, ONNX session,
+    CTranslate2 buffers); paying them here keeps them off the first candidate.
+    Whisper runs without the VAD filter, which would skip silence entirely.
+    """
+    start = time.perf_counter()
+    with open(WARMUP_CLIP, "rb") as f:
+        audio = decode_pcm(f.read())
+    whisper_vad.get_speech_timestamps(audio, whisper_vad.VadOptions())
+    segs, _ = model.transcribe(audio, beam_size=1, temperature=0.0, vad_filter=False, without_timestamps=True)
+    for _ in segs: pass  # Segments decode lazily
+    logger.info(f"🔥 Whisper warm-up took {time.perf_counter() - start:.2f}s")
+
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+# Common Whisper hallucinations: stock phrases from its training subtitles and
+# single words it emits on silence or noise
+DEFAULT_HALLUCINATIONS = (
+    "thanks for watching", "thank you for watching", "please subscribe",
+    "like and subscribe", "don't forget to subscribe",
+    "subtitles by the amara.org community", "thank you so much for watching",
+    "thank you", "you", "bye", "okay", "ok", "be", "to", "the", "it", "i", "me",
+    "a little bit of", "um", "uh", "hmm"
+)
+DEFAULT_FILLER_WORDS = ("a", "the", "of", "to", "and", "in", "is", "it", "that", "for", "on", "with", "as", "at", "by")
+
+class TranscriptFilter:
+    """Drops Whisper hallucinations: repetition loops, stock phrases and filler-only text.
+
+    Phrase lists are normalized and compiled once; each call is a few passes over
+    the words of one utterance.
+    """
+
+    def __init__(self, hallucinations=DEFAULT_HALLUCINATIONS, filler_words=DEFAULT_FILLER_WORDS,
+                 ngram_sizes=(3, 4, 5), min_repeats: int = 3):
+        normalized = {self.normalize(h) for h in hallucinations} - {""}
+        self.words = frozenset(h for h in normalized if " " not in h)
+        phrases = sorted((h for h in normalized if " " in h), key=len, reverse=True)
+        self.phrases = re.compile(r"\b(?:" + "|".join(map(re.escape, phrases)) + r")\b") if phrases else None
+        self.vocabulary = self.words.union(*(p.split() for p in phrases))
+        self.fillers = frozenset(self.normalize(w) for w in filler_words)
+        self.ngram_sizes = tuple(sorted(ngram_sizes))
+        self.min_repeats = min_repeats
+
+    @classmethod
+    def from_file(cls, path: str) -> "TranscriptFilter":
+        """Loads phrase lists from JSON: {"hallucinations": [...], "filler_words": [...]}."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(**{k: data[k] for k in ("hallucinations", "filler_words", "ngram_sizes", "min_repeats") if k in data})
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return text.lower().translate(PUNCTUATION_TABLE).strip()
+
+    def repeated_ngram(self, words: list, distinct: int):
+        """3/4/5-word sequence repeated like a decoding loop, or None.
+
+        A loop either keeps returning to the opening words or repeats a sequence
+        min_repeats times back to back. A phrase that merely recurs through a
+        varied answer ("a lot of ... a lot of ...") is not one.
+        """
+        first = words[0]
+        if words.count(first) >= self.min_repeats:
+            for n in self.ngram_sizes:
+                lead = words[:n]
+                count = sum(1 for i in range(len(words) - n + 1) if words[i] == first and words[i:i + n] == lead)
+                if count >= self.min_repeats:
+                    return tuple(lead)
+        # A back-to-back loop repeats at least n * (min_repeats - 1) words
+        if len(words) - distinct < self.ngram_sizes[0] * (self.min_repeats - 1):
+            return None
+        for n in self.ngram_sizes:
+            # Each word equal to the one n places back, for n * (min_repeats - 1)
+            # words in a row, is one n-gram repeated min_repeats times in a row
+            needed, run = n * (self.min_repeats - 1), 0
+            for i in range(n, len(words)):
+                run = run + 1 if words[i] == words[i - n] else 0
+                if run >= needed:
+                    start = i - needed - n + 1
+                    return tuple(words[start:start + n])
+        return None
+
+    def reason(self, text: str):
+        """Why text looks like a hallucination, or None if it should be kept."""
+        cleaned = self.normalize(text)
         words = cleaned.split()
+        if not words or len(cleaned) < 2:
+            return "empty"
+
+        # 1. Nothing but stock phrases and hallucinated words (regex only if every word could be part of one)
+        if self.vocabulary.issuperset(words):
+            rest = self.phrases.sub(" ", cleaned).split() if self.phrases else words
+            if all(w in self.words for w in rest):
+                return "hallucination"
+
+        # 2. Mostly filler words
+        if len(words) > 3 and sum(map(self.fillers.__contains__, words)) / len(words) > 0.8:
+            return "filler-heavy text"
+
+        if len(words) <= 5:
+            return None
+        # 3. Same few words repeated many times
+        distinct = len(set(words))
+        ratio = len(words) / distinct
+        if ratio > 4:
+            return f"excessive repetition (ratio {ratio:.1f})"
+
+        # 4. Repetition loops (e.g. "a little bit of" repeated); only long texts can hold one
         if len(words) > 10:
-            # Check for repeated sequences
-            # Look for 3-word, 4-word, and 5-word patterns
-            for pattern_length in [3, 4, 5]:
-                if len(words) >= pattern_length * 3:  # At least 3 repetitions
-                    pattern = ' '.join(words[:pattern_length])
-                    # Count how many times this pattern appears
-                    pattern_count = cleaned.count(pattern)
-                    if pattern_count >= 3:
-                        logger.info(f"🔇 Filtered repetitive pattern: '{pattern}' repeated {pattern_count} times")
-                        return ""
-        
-        # 2. Check for excessive word repetition
-        if len(words) > 5:
-            unique_words = set(words)
-            repetition_ratio = len(words) / len(unique_words)
-            if repetition_ratio > 4:  # Same words repeated too many times
-                logger.info(f"🔇 Filtered excessive repetition: ratio {repetition_ratio:.1f}")
-                return ""
-        
-        # 3. Common Whisper hallucinations
-        hallucinations = [
-            "thanks for watching", "thank you for watching", "please subscribe",
-            "like and subscribe", "don't forget to subscribe",
-            "thank you", "you", "bye", "okay", "ok", "be", "to", "the", "it", "i", "me",
-            "a little bit of", "um", "uh", "hmm"
-        ]
-        
-        # Check if the text is just a repetition of hallucination phrases
-        if not words: 
-            return ""
-        
-        # Check if entire text matches common hallucinations
-        is_hallucination = all(w in hallucinations for w in words)
-        
-        # Check if text is too short or matches hallucination patterns
-        if is_hallucination or len(cleaned) < 2:
-            logger.info(f"🔇 Filtered hallucination: '{text}'")
+            gram = self.repeated_ngram(words, distinct)
+            if gram:
+                return f"repetitive pattern '{' '.join(gram)}'"
+        return None
+
+    def __call__(self, text: str) -> str:
+        """Returns the text, or "" when it looks like a Whisper hallucination."""
+        reason = self.reason(text)
+        if reason:
+            logger.info(f"🔇 Filtered {reason}: '{text}'")
             return ""
-        
-        # 4. Check if text is mostly filler words
-        filler_words = {"a", "the", "of", "to", "and", "in", "is", "it", "that", "for", "on", "with", "as", "at", "by"}
-        if len(words) > 3:
-            filler_count = sum(1 for w in words if w in filler_words)
-            if filler_count / len(words) > 0.8:  # More than 80% filler words
-                logger.info(f"🔇 Filtered filler-heavy text: '{text}'")
-                return ""
-            
-        logger.info(f"🎤 User: {text}")
+        return text
+
+transcript_filter = (
+    TranscriptFilter.from_file(Config.TRANSCRIPT_FILTER_FILE) if Config.TRANSCRIPT_FILTER_FILE else TranscriptFilter()
+)
+
+def transcribe(model: "WhisperModel", audio: np.ndarray):
+    try:
+        text = run_whisper(model, audio)
+        text = transcript_filter(text)
+        if text:
+            logger.info(f"🎤 User: {text}")
         return text
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         return ""
 
+class StreamingTranscriber:
+    """Incrementally transcribes one utterance sent as small MediaRecorder frames.
+
+    Frames are appended as they arrive. Each step decodes the buffer and runs VAD
+    over the audio that is not final yet; speech chunks followed by enough silence
+    are committed as final text, and the last STT_PARTIAL_WINDOW_S of the open tail
+    is transcribed as a partial, so a step costs the same however long the
+    utterance gets. Whisper runs through the STT scheduler, which applies the
+    speech gate (dropping silent audio and trimming trailing silence) and batches
+    the audio with other sessions' jobs.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.committed = 0  # samples already emitted as final text
+        self.final_parts = []
+        self.last_step = 0.0
+
+    def feed(self, frame: bytes):
+        self.buf += frame
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last_step >= Config.STT_PARTIAL_INTERVAL_MS / 1000
+
+    def split(self, final: bool = False):
+        """Decodes the buffer and returns (audio to commit, audio for a partial); either may be None."""
+        try:
+            audio = decode_pcm(bytes(self.buf))
+        except Exception:
+            return None, None  # Container not decodable yet, wait for more frames
+        window = audio[self.committed:]
+
+        if final:
+            commit_end = len(window)
+        else:
+            min_silence = Config.STT_MIN_SILENCE_MS * 16
+            speech = whisper_vad.get_speech_timestamps(window, whisper_vad.VadOptions(min_silence_duration_ms=Config.STT_MIN_SILENCE_MS))
+            if not speech:
+                return None, None
+            closed = [s for s in speech if s["end"] <= len(window) - min_silence]
+            commit_end = closed[-1]["end"] if closed else 0
+
+        commit = window[:commit_end] if commit_end > 0 else None
+        self.committed += commit_end
+        tail = window[commit_end:]
+        partial = None
+        if not final and len(tail) >= 16000 * Config.STT_MIN_PARTIAL_MS // 1000:
+            partial = tail[-int(Config.STT_PARTIAL_WINDOW_S * 16000):]
+        return commit, partial
+
+    async def step(self, scheduler: "SttScheduler", final: bool = False) -> list:
+        """Transcribes what the buffer holds so far and returns partial/final transcript events."""
+        self.last_step = time.monotonic()
+        commit, partial = await asyncio.to_thread(self.split, final)
+        events = []
+        if commit is not None:
+            text = await scheduler.transcribe_samples(commit)
+            if text:
+                self.final_parts.append(text)
+                events.append({"type": "transcript", "final": True, "content": text})
+        if partial is not None:
+            text = await scheduler.transcribe_samples(partial)
+            if text:
+                events.append({"type": "transcript", "final": False, "content": text})
+        return events
+
+    async def finish(self, scheduler: "SttScheduler"):
+        """Flushes the remaining audio and returns (events, full utterance text)."""
+        events = await self.step(scheduler, final=True)
+        text = " ".join(self.final_parts).strip()
+        if text:
+            logger.info(f"🎤 User (streamed): {text}")
+        return events, text
+
+# --- STT SCHEDULER ---
+class SttOverloaded(Exception):
+    """Raised when the STT queue is full and the job is rejected."""
+
+class SttJob:
+    def __init__(self, loop, future, fn=None, args=(), data=None, audio=None):
+        self.loop = loop
+        self.future = future
+        self.fn = fn        # generic job: fn(model, *args)
+        self.args = args
+        self.data = data    # whole-utterance job: encoded audio, eligible for batching
+        self.audio = audio  # same with decoded 16 kHz samples (streamed utterances)
+        self.queued = time.perf_counter()
+
+    def resolve(self, result=None, error=None):
+        def _set():
+            if self.future.done(): return
+            if error is not None: self.future.set_exception(error)
+            else: self.future.set_result(result)
+        self.loop.call_soon_threadsafe(_set)
+
+class SttScheduler:
+    """Dedicated Whisper worker pool shared by every session on this worker.
+
+    Jobs go into a bounded queue served by a fixed set of model replicas, one
+    thread each (CTranslate2 releases the GIL while decoding). A worker drains the
+    jobs that arrive within STT_BATCH_WINDOW_MS and runs the whole-utterance ones
+    as a single batched forward pass via BatchedInferencePipeline.
+    """
+
+    MAX_BATCH_SAMPLES = 30 * 16000  # Whisper window; longer clips run on their own
+
+    def __init__(self):
+        self.cpu_threads = Config.STT_CPU_THREADS
+        self.replicas = Config.STT_REPLICAS or max(1, (os.cpu_count() or 1) // self.cpu_threads)
+        self.batch_size = Config.STT_BATCH_SIZE
+        self.batch_window = Config.STT_BATCH_WINDOW_MS / 1000
+        self.jobs = queue.Queue(maxsize=Config.STT_QUEUE_SIZE)
+        self.threads = []
+        self.loaded = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # Set once one replica is loaded and warmed up
+        self.done = [threading.Event() for _ in range(self.replicas)]  # Per replica, loaded or failed
+
+    def start(self):
+        """Starts the replica threads; each loads (and warms up) its model in the background.
+
+        Replica 0 loads first so a cold cache is downloaded once and the first
+        replica is ready as early as possible; the others then load in parallel.
+        """
+        logger.info(f"🚀 Loading Whisper ({Config.WHISPER_MODEL_SIZE}) x{self.replicas}, {self.cpu_threads} threads each...")
+        for i in range(self.replicas):
+            t = threading.Thread(target=self._worker, args=(i,), name=f"stt-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def wait_loaded(self):
+        """Blocks until every replica has loaded or failed."""
+        for event in self.done:
+            event.wait()
+
+    def depth(self) -> int:
+        return self.jobs.qsize()
+
+    def _load(self, index: int):
+        if index:
+            self.done[0].wait()
+        start = time.perf_counter()
+        try:
+            model = faster_whisper.WhisperModel(Config.WHISPER_MODEL_SIZE, device="cpu", compute_type=Config.WHISPER_COMPUTE,
+                                                cpu_threads=self.cpu_threads, num_workers=1)
+        except Exception as e:
+            logger.error(f"Whisper replica {index} failed to load: {e}")
+            startup_errors[f"whisper-{index}"] = str(e)
+            model = None
+        if model is not None and Config.STT_WARMUP:
+            try:
+                warm_up(model)
+            except Exception as e:
+                logger.warning(f"Whisper warm-up failed: {e}")
+        with self.lock:
+            if model is None:
+                self.failed += 1
+            else:
+                self.loaded += 1
+        if model is not None:
+            self.ready.set()
+            logger.info(f"✅ Whisper replica {index} ready in {time.perf_counter() - start:.1f}s")
+        self.done[index].set()
+        return model
+
+    def _submit(self, **kwargs):
+        if self.failed == self.replicas:
+            raise SttOverloaded("No Whisper replica could be loaded")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self.jobs.put_nowait(SttJob(loop, future, **kwargs))
+        except queue.Full:
+            raise SttOverloaded(f"STT queue full ({self.jobs.maxsize} jobs)")
+        return future
+
+    async def transcribe(self, data: bytes) -> str:
+        """Transcribes a whole encoded utterance."""
+        return await self._submit(data=data)
+
+    async def transcribe_samples(self, audio: np.ndarray) -> str:
+        """Transcribes decoded 16 kHz samples; gated and batched like whole utterances."""
+        return await self._submit(audio=audio)
+
+    async def run(self, fn, *args):
+        """Runs fn(model, *args) on a replica and returns its result."""
+        return await self._submit(fn=fn, args=args)
+
+    def _worker(self, index: int):
+        model = self._load(index)
+        if model is None: return
+        pipeline = faster_whisper.BatchedInferencePipeline(model) if self.batch_size > 1 else None
+        while True:
+            jobs = [self.jobs.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(jobs) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                try:
+                    jobs.append(self.jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch = []
+            for job in jobs:
+                governor.record_wait("stt", time.perf_counter() - job.queued)
+                if job.fn is not None:
+                    self._run_job(job, job.fn, model, *job.args)
+                    continue
+                audio = job.audio
+                if audio is None:
+                    try:
+                        with stage("decode"):
+                            audio = decode_pcm(job.data)
+                    except Exception as e:
+                        logger.error(f"Transcription error: {e}")
+                        job.resolve("")
+                        continue
+                if Config.STT_VAD_GATE:
+                    with stage("vad"):
+                        audio = speech_gate(audio)
+                    if audio is None:
+                        logger.info("🔇 No speech in clip, skipped Whisper")
+                        job.resolve("")
+                        continue
+                if pipeline is None or len(audio) > self.MAX_BATCH_SAMPLES:
+                    self._run_job(job, transcribe, model, audio)
+                else:
+                    batch.append((job, audio))
+
+            if len(batch) == 1:
+                job, audio = batch[0]
+                self._run_job(job, transcribe, model, audio)
+            elif batch:
+                self._run_batch(pipeline, batch)
+
+    def _run_job(self, job, fn, *args):
+        try:
+            job.resolve(fn(*args))
+        except Exception as e:
+            job.resolve(error=e)
+
+    def _run_batch(self, pipeline: "BatchedInferencePipeline", batch: list):
+        """Transcribes several utterances in one forward pass.
+
+        The clips are laid end to end with a short silence gap and passed as
+        clip_timestamps, so each one becomes its own row of the batch; segments are
+        mapped back to their clip by start time.
+        """
+        gap = np.zeros(1600, dtype=np.float32)  # 100 ms
+        parts, starts, clips, offset = [], [], [], 0
+        for _, audio in batch:
+            starts.append(offset / 16000)
+            clips.append({"start": offset / 16000, "end": (offset + len(audio)) / 16000})
+            parts += [audio, gap]
+            offset += len(audio) + len(gap)
+
+        options = {k: v for k, v in WHISPER_OPTIONS.items() if k != "vad_filter"}
+        texts = [[] for _ in batch]
+        start = time.perf_counter()
+        try:
+            segs, info = pipeline.transcribe(np.concatenate(parts), clip_timestamps=clips,
+                                             batch_size=len(batch), **options)
+            for seg in segs:
+                if keep_segment(seg):
+                    texts[max(0, bisect.bisect_right(starts, seg.start + 1e-3) - 1)].append(seg.text)
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe("whisper_batch", elapsed)
+            speech_gate.record_whisper(elapsed, sum(len(audio) for _, audio in batch))
+        except Exception as e:
+            logger.error(f"Batched transcription error: {e}")
+            for job, _ in batch:
+                job.resolve("")
+            return
+
+        logger.info(f"🎤 Batched {len(batch)} utterances")
+        for (job, _), seg_texts in zip(batch, texts):
+            text = transcript_filter(" ".join(seg_texts).strip())
+            if text:
+                logger.info(f"🎤 User: {text}")
+            job.resolve(text)
+
 # --- WEBSOCKET ---
 @app.websocket("/ws")
 async def ws_endpoint(websocket: WebSocket):
+    global active_sessions
     await websocket.accept()
+    active_sessions += 1
     logger.info("🔌 Connected")
     
-    # Connection state
-    history = []
-    coding_phase = False
-    coding_completed = False
-    selected_role = "general"  # Default role
+    # Connection state; the interview itself lives in state (see SESSION STATE)
+    state = None
+    stt_stream = None  # StreamingTranscriber while the client streams an utterance
+    stt_task = None
+    drop_utterance = False  # Set when a streamed utterance hit the audio rate limit
+    audio_bucket = TokenBucket(Config.AUDIO_RATE_PER_SEC, Config.AUDIO_BURST)
 
-    async def send_txt(t):
+    async def send_txt(t, turn=None):
         try:
             if websocket.client_state == WebSocketState.CONNECTED:
-                await websocket.send_json({"type": "text", "content": t, "sender": "agent"})
+                msg = {"type": "text", "content": t, "sender": "agent"}
+                if turn is not None: msg["turn"] = turn
+                await websocket.send_json(msg)
         except: pass
 
     async def send_aud(b):
         try:
             if websocket.client_state == WebSocketState.CONNECTED:
+                start = time.perf_counter()
                 await websocket.send_bytes(b)
+                STAGE_SECONDS.observe("ws_send", time.perf_counter() - start)
         except: pass
 
     async def send_json_raw(j):
         try:
             if websocket.client_state == WebSocketState.CONNECTED:
+                start = time.perf_counter()
                 await websocket.send_json(j)
+                STAGE_SECONDS.observe("ws_send", time.perf_counter() - start)
         except: pass
 
-    # Wait for role selection
+    audio_seq = 0
+
+    async def speak(text, source=None):
+        """Sends TTS audio for text, streamed as audio_start / frames / audio_end.
+
+        source optionally replaces stream_tts(text) with chunks that are already
+        being synthesized (see prefetch_tts).
+        """
+        nonlocal audio_seq
+        if not Config.TTS_STREAMING:
+            if source is None:
+                aud = await generate_tts(text)
+            else:
+                aud = b"".join([data async for data in source])
+            if aud: await send_aud(aud)
+            return
+        audio_seq += 1
+        stream_id = audio_seq
+        started = False
+        size = 0
+        try:
+            async for data in (source or stream_tts(text)):
+                if not started:
+                    await send_json_raw({"type": "audio_start", "id": stream_id, "format": "audio/mpeg"})
+                    started = True
+                size += len(data)
+                await send_aud(data)
+        except Exception as e:
+            logger.error(f"TTS Error: {e}")
+        if started:
+            await send_json_raw({"type": "audio_end", "id": stream_id})
+            logger.info(f"✅ TTS Streamed: {size} bytes")
+
+    async def stream_reply(contents, config, turn, speak_sentences):
+        """Streams the model reply, sending and speaking each sentence as it completes.
+
+        Sentences are handed to TTS while later ones are still generating; a single
+        speaker task forwards their audio in order. Returns (reply, spoken).
+        """
+        parts, pending, spoken = [], "", False
+        tts_queue = asyncio.Queue()
+
+        async def speaker():
+            while (source := await tts_queue.get()) is not None:
+                await speak(None, source)
+
+        speaker_task = asyncio.create_task(speaker()) if speak_sentences else None
+
+        async def emit(sentence):
+            nonlocal spoken
+            clean = speakable(sentence)
+            if not clean: return
+            await send_json_raw({"type": "text_delta", "turn": turn, "content": clean})
+            if speaker_task:
+                tts_queue.put_nowait(prefetch_tts(clean))
+                spoken = True
+
+        span = start_span("llm", streaming=True)
+        try:
+            async for chunk in chat_stream(contents, config):
+                try:
+                    text = chunk.text
+                except (ValueError, AttributeError):
+                    text = None  # Function-call only chunk
+                if not text: continue
+                if not parts:
+                    STAGE_SECONDS.observe("llm_first_text", time.perf_counter() - span.start)
+                parts.append(text)
+                sentences, pending = split_sentences(pending + text)
+                for sentence in sentences:
+                    await emit(sentence)
+            if pending.strip():
+                await emit(pending)
+        finally:
+            span.end()
+            if speaker_task:
+                tts_queue.put_nowait(None)
+                await speaker_task
+
+        reply = "".join(parts)
+        if reply:
+            logger.info(f"✅ Got streamed response: {reply[:50]}...")
+        return reply, spoken
+
+    async def stt_partial(stream):
+        try:
+            for event in await stream.step(stt_scheduler):
+                await send_json_raw(event)
+        except Exception as e:
+            logger.error(f"Streaming STT error: {e}")
+
+    # Admission: wait for a session slot (the client is told its queue position)
+    if not await governor.admit(send_json_raw):
+        logger.warning("⛔ At capacity, turning a session away")
+        await send_json_raw({"type": "server_busy"})
+        active_sessions -= 1
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception: pass
+        return
+
+    # Wait for role selection, or resume_session to continue an interview whose
+    # socket dropped (on this worker or any other sharing SESSION_STORE)
+    resumed = False
     try:
         msg = await websocket.receive()
         data = json.loads(msg["text"])
-        if data.get("type") == "role_selection":
-            selected_role = data.get("role", "general")
-            logger.info(f"📋 Role selected: {selected_role}")
+        if data.get("type") == "resume_session":
+            state = await load_session(data.get("session_id", ""))
+            resumed = state is not None
+        if state is None:
+            role = data.get("role", "general") if data.get("type") in ("role_selection", "resume_session") else "general"
+            state = SessionState(role)
+            logger.info(f"📋 Role selected: {state.role}")
+        else:
+            logger.info(f"🔁 Resumed session {state.id} ({len(state.history)} turns)")
     except:
-        selected_role = "general"
+        state = SessionState()
 
-    # Initial Greeting based on role
-    if RESUME_CONTEXT:
-        greeting = f"Hello! I am SURA, your interview practice partner. I've reviewed your resume and I'll be conducting a {selected_role.replace('_', ' ')} interview today. Let's begin - tell me about yourself?"
-    else:
-        greeting = f"Hello! I am SURA, your interview practice partner. I'll be conducting a {selected_role.replace('_', ' ')} interview today. Let's begin - tell me about yourself?"
-    history.append({"role": "model", "parts": [{"text": greeting}]})
-    await send_txt(greeting)
-    aud = await generate_tts(greeting)
-    if aud: await send_aud(aud)
+    # Resume uploaded for this session (see /upload_resume)
+    session_token = websocket.query_params.get("session")
+    if session_token and not resumed:
+        state.feedback_key = session_token
+
+    async def on_resume_ready(job):
+        if job.get("status") != "success":
+            await send_json_raw({"type": "resume_error", "message": job.get("message", "Resume parsing failed")})
+            return
+        state.resume_text = await resume_store.session_text(session_token) or state.resume_text
+        await send_json_raw({"type": "resume_ready", "length": len(state.resume_text)})
 
+    if session_token:
+        # Registered before the lookup and greeting so a parse finishing meanwhile is not missed
+        session_listeners[session_token].add(on_resume_ready)
     try:
+        if session_token and not state.resume_text:
+            try:
+                state.resume_text = await resume_store.session_text(session_token) or ""
+            except Exception as e:
+                logger.error(f"Resume lookup failed: {e}")
+            if state.resume_text:
+                logger.info(f"📄 Using resume context ({len(state.resume_text)} chars)")
+
+        await send_json_raw({"type": "session", "session_id": state.id, "resumed": resumed, "role": state.role,
+                             "coding_completed": state.coding_completed, "turn": state.turn_seq})
+        if not resumed:
+            # Initial Greeting based on role
+            greeting = build_greeting(state.role, bool(state.resume_text))
+            state.history.append({"role": "model", "parts": [{"text": greeting}]})
+            await save_session(state)
+            await send_txt(greeting)
+            await speak(greeting)
+
         while True:
             try:
                 msg = await websocket.receive()
@@ -528,12 +3538,31 @@ async def ws_endpoint(websocket: WebSocket):
                 break
             
             if msg["type"] == "websocket.disconnect": break
-            
+
             user_text = ""
             if "bytes" in msg:
-                if coding_phase:
+                if state.coding_phase or drop_utterance:
+                    continue
+                if not audio_bucket.allow():
+                    # Over the per-session audio rate; a streamed utterance is dropped whole
+                    governor.stats["audio_rate_limited"] += 1
+                    drop_utterance = stt_stream is not None
+                    stt_stream = None
+                    await send_json_raw({"type": "rate_limited"})
+                    continue
+                if stt_stream is not None:
+                    # Streaming mode: buffer the frame and refresh the partial transcript
+                    stt_stream.feed(msg["bytes"])
+                    if stt_stream.due() and (stt_task is None or stt_task.done()):
+                        stt_task = asyncio.create_task(stt_partial(stt_stream))
+                    continue
+                try:
+                    with stage("stt"):
+                        user_text = await stt_scheduler.transcribe(msg['bytes'])
+                except SttOverloaded as e:
+                    logger.warning(f"⚠️ {e}")
+                    await send_json_raw({"type": "stt_busy"})
                     continue
-                user_text = await asyncio.to_thread(transcribe, msg['bytes'])
                 if not user_text: continue
                 await send_txt(user_text)
 
@@ -542,134 +3571,170 @@ async def ws_endpoint(websocket: WebSocket):
                     data = json.loads(msg["text"])
                     if data.get("type") == "code_submission":
                         if data.get("problem_id"):
-                            res = submit_code(data["problem_id"], data["code"])
+                            res = await submit_code(data["problem_id"], data["code"])
                             if "FAILED" not in res:
-                                coding_phase = False
-                                coding_completed = True
+                                state.coding_phase = False
+                                state.coding_completed = True
                         else:
-                            res = run_playground_code(data["code"])
+                            res = await run_playground_code(data["code"])
                         await send_json_raw({"type": "code_result", "output": res})
                         user_text = f"Code Submitted. Result:\n{res}"
                     elif data.get("type") == "request_feedback":
-                        # Generate and send feedback
-                        feedback = generate_feedback(history, selected_role)
-                        await send_json_raw({"type": "feedback", "data": feedback})
+                        # Generated in the background; the result arrives as a "feedback" message
+                        job_id = await feedback_queue.submit(state.feedback_key, state.history, state.role, send_json_raw)
+                        await send_json_raw({"type": "feedback_pending", "job_id": job_id})
+                        continue
+                    elif data.get("type") == "stt_start":
+                        drop_utterance = False
+                        stt_stream = None if state.coding_phase else StreamingTranscriber()
                         continue
+                    elif data.get("type") in ("stt_end", "stt_cancel"):
+                        drop_utterance = False
+                        stream, stt_stream = stt_stream, None
+                        if stt_task:
+                            await stt_task
+                            stt_task = None
+                        if stream is None or data["type"] == "stt_cancel":
+                            continue
+                        try:
+                            with stage("stt", streaming=True):
+                                events, user_text = await stream.finish(stt_scheduler)
+                        except Exception as e:
+                            logger.error(f"Streaming STT error: {e}")
+                            events, user_text = [], ""
+                        for event in events:
+                            await send_json_raw(event)
+                        if not user_text: continue
+                        await send_txt(user_text)
                     elif data.get("type") == "drop_test":
                         logger.info("❌ User dropped the coding test")
-                        coding_completed = True
+                        state.coding_completed = True
                         user_text = "[SYSTEM: User dropped the coding test. They get 0 marks for this section. Please acknowledge this briefly and continue with the next part of the interview.]"
                     else: 
                         user_text = data.get("text", "")
-                        if coding_phase and user_text:
+                        if state.coding_phase and user_text:
                             continue
                 except: user_text = msg["text"]
 
             if not user_text: continue
 
-            history.append({"role": "user", "parts": [{"text": user_text}]})
+            # Root span of the dispatched turn, up to the spoken reply
+            with stage("turn", root=True, role=state.role):
+                state.history.append({"role": "user", "parts": [{"text": user_text}]})
             
-            # Get role-specific system prompt
-            system_prompt = INTERVIEW_PROMPTS.get(selected_role, INTERVIEW_PROMPTS["general"])
-            if RESUME_CONTEXT:
-                # Limit resume context to prevent token overflow (max 800 chars for safety)
-                resume_snippet = RESUME_CONTEXT[:800] if len(RESUME_CONTEXT) > 800 else RESUME_CONTEXT
-                system_prompt += f"\n\nCANDIDATE RESUME:\n{resume_snippet}\n\nAsk specific questions about their resume."
-                logger.info(f"📄 Using resume context ({len(resume_snippet)} chars)")
-            system_prompt += f"\n\nCoding completed: {coding_completed}"
-            logger.info(f"🤖 Sending to AI with history length: {len(history)}")
+                logger.info(f"🤖 Sending to AI with history length: {len(state.history)}")
             
-            try:
-                resp = client.models.generate_content(
-                    model=Config.MODEL_ID, contents=history,
-                    config=types.GenerateContentConfig(
-                        tools=[get_random_problem, verify_concept],
-                        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=False),
-                        system_instruction=system_prompt
-                    )
-                )
-                
-                # Better handling of empty responses and function calls
-                reply = None
                 try:
-                    # When automatic_function_calling is enabled, the response might have:
-                    # 1. Just text
-                    # 2. Function calls that were executed automatically
-                    # 3. Both
-                    # 4. Neither (error case)
+                    # Role-specific prompt (cached when possible); resume retrieval keys on
+                    # the latest answer and the question it responds to
+                    query = f"{state.history.last_text('model')}\n{user_text}"
+                    config, preamble = await chat_config(state.role, state.resume_text, state.coding_completed, query)
+                    contents = preamble + state.history.contents()
+                    shed = governor.shedding
+                    if shed:
+                        # Overloaded: ask for a short reply and send it without TTS
+                        governor.stats["shed_turns"] += 1
+                        last = contents[-1]
+                        contents = contents[:-1] + [{"role": last["role"], "parts": last["parts"] + [{"text": SHED_NOTE}]}]
+                    state.turn_seq += 1
+                    spoken = False
+                    if Config.LLM_PIPELINE:
+                        reply, spoken = await stream_reply(contents, config, state.turn_seq,
+                                                           speak_sentences=not state.coding_phase and not shed)
+                    else:
+                        resp = await chat_generate(contents, config)
+                
+                        # Better handling of empty responses and function calls
+                        reply = None
+                        try:
+                            # When automatic_function_calling is enabled, the response might have:
+                            # 1. Just text
+                            # 2. Function calls that were executed automatically
+                            # 3. Both
+                            # 4. Neither (error case)
                     
-                    if resp and hasattr(resp, 'candidates') and resp.candidates:
-                        # Check if there's actual content
-                        candidate = resp.candidates[0]
-                        if hasattr(candidate, 'content') and candidate.content:
-                            # Try to get text
-                            if hasattr(resp, 'text'):
-                                try:
-                                    reply = resp.text
-                                    if reply:
-                                        logger.info(f"✅ Got text response: {reply[:50]}...")
-                                except ValueError:
-                                    # This happens when response only has function calls
-                                    logger.info("ℹ️ Response contains only function calls, no text")
+                            if resp and hasattr(resp, 'candidates') and resp.candidates:
+                                # Check if there's actual content
+                                candidate = resp.candidates[0]
+                                if hasattr(candidate, 'content') and candidate.content:
+                                    # Try to get text
+                                    if hasattr(resp, 'text'):
+                                        try:
+                                            reply = resp.text
+                                            if reply:
+                                                logger.info(f"✅ Got text response: {reply[:50]}...")
+                                        except ValueError:
+                                            # This happens when response only has function calls
+                                            logger.info("ℹ️ Response contains only function calls, no text")
                     
-                    # If still no reply, check if it was a function-only response
-                    if not reply and resp and hasattr(resp, 'candidates'):
-                        logger.warning("⚠️ No text in response after function calling")
+                            # If still no reply, check if it was a function-only response
+                            if not reply and resp and hasattr(resp, 'candidates'):
+                                logger.warning("⚠️ No text in response after function calling")
                         
-                except (ValueError, AttributeError) as e:
-                    logger.warning(f"⚠️ Could not extract text from response: {e}")
+                        except (ValueError, AttributeError) as e:
+                            logger.warning(f"⚠️ Could not extract text from response: {e}")
                 
-                if not reply or len(reply.strip()) == 0:
-                    logger.warning("⚠️ Model returned empty response, using fallback")
-                    reply = "I see. Could you tell me more about that?"
+                    if not reply or len(reply.strip()) == 0:
+                        logger.warning("⚠️ Model returned empty response, using fallback")
+                        reply = FALLBACK_REPLY
+                        spoken = False
                 
-                # Check for interview end
-                if "[[END_INTERVIEW]]" in reply:
-                    reply = reply.replace("[[END_INTERVIEW]]", "").strip()
-                    history.append({"role": "model", "parts": [{"text": reply}]})
-                    await send_txt(reply)
-                    aud = await generate_tts(reply)
-                    if aud: await send_aud(aud)
+                    # Check for interview end
+                    if "[[END_INTERVIEW]]" in reply:
+                        reply = reply.replace("[[END_INTERVIEW]]", "").strip()
+                        state.history.append({"role": "model", "parts": [{"text": reply}]})
+                        await send_txt(reply, state.turn_seq)
+                        if not spoken and not shed: await speak(reply)
                     
-                    # Generate and send feedback
-                    feedback = generate_feedback(history, selected_role)
-                    await send_json_raw({"type": "feedback", "data": feedback})
-                    continue
+                        # Generate and send feedback in the background
+                        job_id = await feedback_queue.submit(state.feedback_key, state.history, state.role, send_json_raw)
+                        await send_json_raw({"type": "feedback_pending", "job_id": job_id})
+                        continue
                 
-                # Check if AI wants to give coding problem (ONLY for technical roles)
-                if ('"starter_code"' in reply or "START CODING CHALLENGE" in reply) and not coding_completed and selected_role in ["software_engineer", "product_manager"]:
-                    problem_json = get_random_problem()
-                    try:
-                        problem_data = json.loads(problem_json)
-                        await send_json_raw({"type": "show_button", "problem": problem_data})
-                        if '"starter_code"' in reply:
-                            m = re.search(r'\{[^{}]*"starter_code"[^{}]*\}', reply, re.DOTALL)
-                            if m:
-                                reply = reply.replace(m.group(0), "")
-                    except Exception as e:
-                        logger.error(f"Problem data error: {e}")
+                    # Check if AI wants to give coding problem (ONLY for technical roles)
+                    if ('"starter_code"' in reply or "START CODING CHALLENGE" in reply) and not state.coding_completed and state.role in ["software_engineer", "product_manager"]:
+                        problem_json = get_random_problem()
+                        try:
+                            problem_data = json.loads(problem_json)
+                            await send_json_raw({"type": "show_button", "problem": problem_data})
+                            if '"starter_code"' in reply:
+                                m = re.search(r'\{[^{}]*"starter_code"[^{}]*\}', reply, re.DOTALL)
+                                if m:
+                                    reply = reply.replace(m.group(0), "")
+                        except Exception as e:
+                            logger.error(f"Problem data error: {e}")
 
-                history.append({"role": "model", "parts": [{"text": reply}]})
-                await send_txt(reply)
+                    state.history.append({"role": "model", "parts": [{"text": reply}]})
+                    await send_txt(reply, state.turn_seq)
                 
-                # Skip TTS during coding phase
-                if not coding_phase:
-                    aud = await generate_tts(reply)
-                    if aud: await send_aud(aud)
-                else:
-                    logger.info("🔇 Skipping TTS during coding phase")
+                    # Skip TTS during coding phase and while shedding load
+                    if state.coding_phase:
+                        logger.info("🔇 Skipping TTS during coding phase")
+                    elif shed:
+                        logger.info("🔇 Skipping TTS while shedding load")
+                    elif not spoken:
+                        await speak(reply)
 
-            except Exception as e:
-                logger.error(f"AI Error: {e}")
-                # Provide fallback response on error
-                error_reply = "I apologize, I had a technical issue. Could you please repeat that?"
-                history.append({"role": "model", "parts": [{"text": error_reply}]})
-                await send_txt(error_reply)
-                aud = await generate_tts(error_reply)
-                if aud: await send_aud(aud)
+                except Exception as e:
+                    logger.error(f"AI Error: {e}")
+                    # Provide fallback response on error
+                    error_reply = ERROR_REPLY
+                    state.history.append({"role": "model", "parts": [{"text": error_reply}]})
+                    await send_txt(error_reply)
+                    await speak(error_reply)
+                finally:
+                    # Persist after every turn so a reconnect (to any worker) resumes from here
+                    await save_session(state)
 
     except Exception as e:
         logger.error(f"Socket Loop Error: {e}")
+    finally:
+        active_sessions -= 1
+        governor.release()
+        if session_token:
+            session_listeners[session_token].discard(on_resume_ready)
+            if not session_listeners[session_token]:
+                del session_listeners[session_token]
 
 if __name__ == "__main__":
     import uvicorn
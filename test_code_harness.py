@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+import main3
+
+STATEFUL_SOLUTION = """
+print("loaded")
+seen = []
+
+def add(item):
+    seen.append(item)
+    return len(seen)
+"""
+
+TESTS = [
+    {"input_code": "print(add('a'))", "expected": "loaded\n1"},
+    {"input_code": "add('b')\nprint(add('c'))", "expected": "loaded\n2"},
+    {"input_code": "print(len(seen))", "expected": "loaded\n0"},
+]
+
+def run_script(script: str) -> str:
+    return subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30).stdout
+
+def run_harness(user_code: str, tests: list) -> list:
+    sentinel = "__TEST_RESULTS__"
+    for line in run_script(main3.build_test_harness(user_code, tests, sentinel)).splitlines():
+        if line.startswith(sentinel):
+            return json.loads(line[len(sentinel):])
+    raise AssertionError("harness did not report")
+
+def test_tests_do_not_share_solution_state():
+    results = run_harness(STATEFUL_SOLUTION, TESTS)
+    assert [r["stdout"].strip() for r in results] == [t["expected"] for t in TESTS]
+    assert all(not r["stderr"] for r in results)
+
+def test_harness_matches_separate_programs():
+    results = run_harness(STATEFUL_SOLUTION, TESTS)
+    for test, result in zip(TESTS, results):
+        assert result["stdout"] == run_script(f"{STATEFUL_SOLUTION}\n\n{test['input_code']}")
+
+def test_syntax_error_fails_every_test():
+    results = run_harness("def broken(:\n", TESTS)
+    assert len(results) == len(TESTS)
+    assert all("SyntaxError" in r["stderr"] for r in results)
+
+if __name__ == "__main__":
+    test_tests_do_not_share_solution_state()
+    test_harness_matches_separate_programs()
+    test_syntax_error_fails_every_test()
+    print("✅ Code harness tests passed")